@@ -6,6 +6,8 @@ from datetime import datetime
 import os
 import json
 import random
+import tempfile
+import threading
 import uuid
 
 
@@ -32,8 +34,25 @@ def load_users():
         with open(USERS_FILE, 'r') as f: return json.load(f)
     except (json.JSONDecodeError, FileNotFoundError): return {}
 
+# Carregar, alterar e salvar acontecem sob users_lock (o Waitress atende com
+# várias threads; sem o lock, dois cadastros simultâneos fazem um perder a
+# conta do outro). A gravação vai para um arquivo temporário com fsync e
+# troca o original com os.replace: um crash no meio deixa o arquivo antigo
+# inteiro em vez de um JSON truncado.
+users_lock = threading.Lock()
+
 def save_users(users):
-    with open(USERS_FILE, 'w') as f: json.dump(users, f, indent=4)
+    directory = os.path.dirname(os.path.abspath(USERS_FILE))
+    fd, tmp_path = tempfile.mkstemp(prefix='.NuksEdition.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(users, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, USERS_FILE)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -100,20 +119,20 @@ def verificar_codigo():
         temp_user = session.get('temp_user')
         if not temp_user: return redirect(url_for('index'))
 
-        users = load_users()
-        
         # É SOMENTE AQUI que a conta é criada e salva no arquivo.
         user_id = str(uuid.uuid4())
         creation_date = datetime.now().strftime('%d/%m/%Y')
         hashed_password = generate_password_hash(temp_user['senha'], method='pbkdf2:sha256')
 
-        users[temp_user['email']] = {
-            'id': user_id,
-            'username': temp_user['usuario'],
-            'password_hash': hashed_password,
-            'data_criacao': creation_date
-        }
-        save_users(users)
+        with users_lock:
+            users = load_users()
+            users[temp_user['email']] = {
+                'id': user_id,
+                'username': temp_user['usuario'],
+                'password_hash': hashed_password,
+                'data_criacao': creation_date
+            }
+            save_users(users)
 
         session.clear()
         session['logged_in'] = True
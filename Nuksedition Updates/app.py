@@ -1,19 +1,129 @@
 from flask import Flask, render_template, request, redirect, url_for, session, send_from_directory, jsonify
-from flask_mail import Mail, Message
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import click
 import os
-import json
-import random
 import uuid
 
+from assets import ImageAssets
+from attempts import AttemptTracker
+from downloads import DownloadManager
+from event_log import EventLog, query as query_events
+from feed import KINDS as FEED_KINDS, Feed
+from hashing import HasherBusy, PasswordHasher
+from mail_queue import MailQueue, create_transport
+import metrics
+from render_cache import RenderCache
+from search_index import IndexedUserStore, UserSearchIndex
+from server_session import create_session_interface
+from shared_backend import create_backend
+import startup
+from user_store import create_store, migrate_json
+from verification import RateLimited, VerificationCodes
+
 
 load_dotenv()
 
 app = Flask(__name__, template_folder='.', static_folder='Public')
 app.secret_key = os.getenv('SECRET_KEY', 'uma-chave-secreta-muito-segura')
 
+# --- Inicialização rápida ---
+# FAST_STARTUP=1 adia o e-mail, o store de usuários, as imagens, os hashes
+# dos downloads e a compilação dos templates: o que não for usado antes é
+# feito numa thread depois que o servidor começa a aceitar conexões
+# (startup.py). 'python app.py --startup-report' mostra onde vai o tempo.
+app.config['FAST_STARTUP'] = os.getenv('FAST_STARTUP', '0') == '1'
+fast_startup = app.config['FAST_STARTUP']
+
+# --- Backend compartilhado ---
+# Estado que todos os processos precisam ver: códigos de verificação,
+# limites de taxa e, com USER_STORE/SESSION_BACKEND=shared, usuários e
+# sessões. Vazio = só este processo; 'sqlite:///nuks-shared.db' para vários
+# processos na mesma máquina; 'redis://host:6379/0' para várias máquinas.
+app.config['SHARED_BACKEND_URL'] = os.getenv('SHARED_BACKEND_URL', '')
+shared = startup.run('backend', create_backend, app.config['SHARED_BACKEND_URL'])
+
+# --- Sessões ---
+# O cookie leva só o id da sessão; os dados ficam no servidor.
+# SESSION_BACKEND: 'sqlite' (sobrevive a reinícios), 'memory', 'shared'
+# (backend compartilhado) ou 'cookie' (sessão assinada padrão do Flask).
+app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'sqlite')
+app.config['SESSION_DB'] = os.getenv('SESSION_DB', 'sessions.db')
+app.config['SESSION_TTL'] = int(os.getenv('SESSION_TTL', 86400))
+app.config['SESSION_SWEEP_INTERVAL'] = int(os.getenv('SESSION_SWEEP_INTERVAL', 60))
+session_interface = startup.run('sessoes', create_session_interface, app.config, shared)
+if session_interface is not None:
+    app.session_interface = session_interface
+
+def regenerate_session():
+    # Troca o id da sessão no login e no fim do cadastro (fixação de sessão).
+    # A sessão em cookie assinado não tem id para trocar.
+    if session_interface is not None:
+        session_interface.regenerate(session)
+
+# --- Métricas ---
+# Tempo por rota e por trecho interno em /metrics (formato Prometheus).
+# METRICS_TOKEN, se definido, exige 'Authorization: Bearer <token>';
+# sem ele, /metrics só responde a conexões locais (127.0.0.1/::1).
+# PROFILING_ENABLED + cabeçalho 'X-Profile: <PROFILING_TOKEN>' grava um
+# cProfile da requisição em PROFILING_DIR.
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED', '0') == '1'
+app.config['PROFILING_TOKEN'] = os.getenv('PROFILING_TOKEN')
+app.config['PROFILING_DIR'] = os.getenv('PROFILING_DIR', 'profiles')
+metrics.init_app(app)
+
+# --- Imagens ---
+# Variantes redimensionadas e versionadas dos PNGs de Imagens/ (assets.py).
+app.config['IMAGE_WIDTHS'] = (64, 128, 256)
+images = ImageAssets(os.path.join(app.root_path, 'Imagens'), widths=app.config['IMAGE_WIDTHS'])
+startup.run('imagens', images.build, defer=fast_startup)
+app.jinja_env.globals.update(image_url=images.url, image_srcset=images.srcset, image_sources=images.sources)
+
+# --- Downloads ---
+# DOWNLOAD_OFFLOAD: vazio (o próprio app envia), 'x-accel' (nginx) ou
+# 'x-sendfile' (Apache/lighttpd).
+app.config['DOWNLOAD_OFFLOAD'] = os.getenv('DOWNLOAD_OFFLOAD') or None
+app.config['DOWNLOAD_ACCEL_PREFIX'] = os.getenv('DOWNLOAD_ACCEL_PREFIX', '/protected-downloads/')
+downloads = DownloadManager(app.root_path, offload=app.config['DOWNLOAD_OFFLOAD'],
+                            accel_prefix=app.config['DOWNLOAD_ACCEL_PREFIX'],
+                            stats_file='downloads_stats.json')
+downloads.register('calculadora', os.path.join('protect', 'Calculadora.exe'))
+# O executável deve estar na pasta 'game' para ser baixado
+downloads.register('snake', os.path.join('snake', 'game', 'NuksEdition_Snake.exe'))
+startup.run('downloads', downloads.build, defer=fast_startup)
+
+# --- Feed ---
+# Catálogo de Explorar/Jogos/Notícias num arquivo NDJSON só de acréscimo
+# (feed.py). Publicações de outros processos aparecem em até
+# FEED_CHECK_INTERVAL segundos. Publique com 'flask feed-publish'.
+# O conteúdo inicial só é gravado no aquecimento (primeira requisição ou
+# launcher), nunca ao importar o app (comandos do flask, benchmark).
+app.config['FEED_FILE'] = os.getenv('FEED_FILE', os.path.join(app.root_path, 'feed.ndjson'))
+app.config['FEED_CHECK_INTERVAL'] = float(os.getenv('FEED_CHECK_INTERVAL', 1.0))
+app.config['FEED_PAGE_SIZE'] = 20
+app.config['FEED_IMAGE_WIDTH'] = 48
+FEED_SEED = [
+    {'kind': 'download', 'title': 'Baixar calculadora', 'url': '/download/calculadora'},
+    {'kind': 'game', 'title': 'Snake', 'url': '/download_snake_game', 'image': 'Jogos.png'},
+]
+feed = Feed(app.config['FEED_FILE'], check_interval=app.config['FEED_CHECK_INTERVAL'])
+startup.run('feed', feed.refresh, True)
+startup.run('conteudo inicial do feed', feed.seed, FEED_SEED, defer=True)
+
+# --- Templates ---
+# Compilados na inicialização; a saída fica em cache com ETag e versões
+# comprimidas (veja render_cache.py).
+# Com FAST_STARTUP, nada entra no cache antes do fim do aquecimento.
+pages = RenderCache(app, ready=startup.ready if fast_startup else None)
+startup.run('templates', pages.precompile, defer=fast_startup)
+
+@app.before_request
+def prewarm_on_first_request():
+    # Servidores externos (flask run, waitress-serve app:app) não chamam
+    # startup.prewarm(); sem isto o que foi adiado nunca rodaria.
+    startup.prewarm()
+
 # --- Configuração do Flask-Mail ---
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
 app.config['MAIL_PORT'] = 465
@@ -22,45 +132,261 @@ app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_USE_TLS'] = False
 app.config['MAIL_USE_SSL'] = True
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
-mail = Mail(app)
-
-USERS_FILE = 'NuksEdition.json'
 
-def load_users():
-    if not os.path.exists(USERS_FILE): return {}
+# --- Fila de e-mails ---
+# MAIL_TRANSPORT=smtp envia de verdade; 'file' grava .eml em MAIL_FILE_DIR e
+# 'null' só guarda as mensagens em memória (útil em testes).
+app.config['MAIL_TRANSPORT'] = os.getenv('MAIL_TRANSPORT', 'smtp')
+app.config['MAIL_FILE_DIR'] = os.getenv('MAIL_FILE_DIR', 'mail_outbox')
+app.config['MAIL_WORKERS'] = int(os.getenv('MAIL_WORKERS', 2))
+app.config['MAIL_MAX_RETRIES'] = int(os.getenv('MAIL_MAX_RETRIES', 3))
+
+def create_mailer():
+    from flask_mail import Mail
+    return MailQueue(app, create_transport(app.config, Mail(app)),
+                     workers=app.config['MAIL_WORKERS'],
+                     max_retries=app.config['MAIL_MAX_RETRIES'])
+
+mailer = startup.lazy('email', create_mailer, defer=fast_startup)
+
+# Assunto e corpo dos e-mails com código; também usados pelo modo ASGI (asgi.py).
+EMAILS = {
+    'cadastro': ('Seu código de confirmação NuksEdition',
+                 'Olá {usuario}, seu código de confirmação é: {codigo}'),
+    'reenvio': ('Seu novo código de confirmação NuksEdition',
+                'Olá {usuario}, seu novo código de confirmação é: {codigo}'),
+    'excluir_conta': ('Seu código de confirmação para exclusão de conta NuksEdition',
+                      'Seu código de confirmação para exclusão de conta é: {codigo}'),
+    'alterar_email': ('Seu código de confirmação para alteração de e-mail NuksEdition',
+                      'Seu código de confirmação para alteração de e-mail é: {codigo}'),
+    'novo_email': ('Seu código de confirmação para o novo e-mail NuksEdition',
+                   'Seu código de confirmação para o novo e-mail é: {codigo}'),
+    'alterar_senha': ('Seu código de confirmação para alteração de senha NuksEdition',
+                      'Seu código de confirmação para alteração de senha é: {codigo}'),
+}
+
+def montar_email(tipo, destinatario, **dados):
+    from flask_mail import Message
+    assunto, corpo = EMAILS[tipo]
+    msg = Message(assunto, recipients=[destinatario])
+    msg.body = corpo.format(**dados)
+    return msg
+
+def enviar_email(tipo, destinatario, **dados):
+    return mailer.enqueue(montar_email(tipo, destinatario, **dados))
+
+# --- Armazenamento de usuários ---
+# USER_STORE=sqlite (padrão) usa um banco indexado por email e id;
+# USER_STORE=json mantém o formato antigo de arquivo único (com lock entre
+# processos); USER_STORE=binary usa o arquivo compacto lido por mmap
+# (binary_store.py); USER_STORE=shared usa o backend compartilhado.
+app.config['USERS_FILE'] = 'NuksEdition.json'
+app.config['USERS_DB'] = os.getenv('USERS_DB', 'NuksEdition.db')
+app.config['USERS_BINARY_FILE'] = os.getenv('USERS_BINARY_FILE', 'NuksEdition.nukb')
+app.config['USER_STORE'] = os.getenv('USER_STORE', 'sqlite')
+# Cache LRU em memória (0 desativa) e intervalo máximo entre verificações
+# de alterações feitas por outros processos.
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 10000))
+app.config['USER_CACHE_CHECK_INTERVAL'] = float(os.getenv('USER_CACHE_CHECK_INTERVAL', 1.0))
+# Busca de usuários: índice em memória mantido pelas próprias escritas;
+# mudanças de outros processos reconstroem o índice a cada
+# SEARCH_REBUILD_INTERVAL segundos no máximo.
+app.config['SEARCH_REBUILD_INTERVAL'] = float(os.getenv('SEARCH_REBUILD_INTERVAL', 30))
+
+def create_users():
+    return IndexedUserStore(create_store(app.config, shared), UserSearchIndex(),
+                            rebuild_interval=app.config['SEARCH_REBUILD_INTERVAL'])
+
+users = metrics.TimedProxy(startup.lazy('usuarios', create_users, defer=fast_startup),
+                           'store', ('get', 'get_by_id', 'exists', 'insert', 'update_field', 'rename', 'delete',
+                                     'search'))
+if fast_startup:
+    startup.run('indice de busca', lambda: users.warm(), defer=True)
+
+# --- Hash de senhas ---
+# O pbkdf2 roda num pool de processos. HASH_WORKERS=0 calcula na própria
+# thread; sem HASH_WORKERS, os núcleos são divididos entre os processos do
+# launcher (veja hashing.py). HASH_MAX_PENDING limita a fila e HASH_TIMEOUT
+# o tempo de cada cálculo antes de responder 503. Ao trocar
+# PASSWORD_HASH_METHOD, os hashes antigos são atualizados no próximo login.
+app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+app.config['HASH_WORKERS'] = int(os.getenv('HASH_WORKERS')) if os.getenv('HASH_WORKERS') else None
+app.config['HASH_MAX_PENDING'] = int(os.getenv('HASH_MAX_PENDING', 64))
+app.config['HASH_TIMEOUT'] = float(os.getenv('HASH_TIMEOUT', 30))
+hasher = metrics.TimedProxy(PasswordHasher(app.config['PASSWORD_HASH_METHOD'],
+                                           workers=app.config['HASH_WORKERS'],
+                                           max_pending=app.config['HASH_MAX_PENDING'],
+                                           timeout=app.config['HASH_TIMEOUT']),
+                            'hash', ('hash', 'verify'))
+if fast_startup:
+    startup.run('pool de hash', hasher.warm, defer=True)
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    if request.is_json:
+        response = jsonify({'success': False, 'error': 'server_busy'})
+    else:
+        response = app.response_class('Servidor ocupado. Tente novamente em instantes.', mimetype='text/plain')
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+# --- Log de eventos ---
+# Cadastros, logins, trocas de email/senha e exclusões vão para um buffer em
+# memória e são gravados em lote por uma thread, em segmentos NDJSON
+# comprimidos ao fechar (event_log.py). Consulte com 'flask events'.
+app.config['EVENT_LOG_DIR'] = os.getenv('EVENT_LOG_DIR', 'events')
+app.config['EVENT_LOG_FLUSH_INTERVAL'] = float(os.getenv('EVENT_LOG_FLUSH_INTERVAL', 1.0))
+app.config['EVENT_LOG_CAPACITY'] = int(os.getenv('EVENT_LOG_CAPACITY', 10000))
+app.config['EVENT_LOG_SEGMENT_BYTES'] = int(os.getenv('EVENT_LOG_SEGMENT_BYTES', 8 * 1024 * 1024))
+app.config['EVENT_LOG_SEGMENT_SECONDS'] = int(os.getenv('EVENT_LOG_SEGMENT_SECONDS', 3600))
+events = EventLog(app.config['EVENT_LOG_DIR'], flush_interval=app.config['EVENT_LOG_FLUSH_INTERVAL'],
+                  capacity=app.config['EVENT_LOG_CAPACITY'],
+                  segment_bytes=app.config['EVENT_LOG_SEGMENT_BYTES'],
+                  segment_seconds=app.config['EVENT_LOG_SEGMENT_SECONDS'])
+
+# --- Tentativas de login e de código ---
+# Erros seguidos bloqueiam a conta (por e-mail e propósito) por prazos que
+# dobram a cada bloqueio; um IP com erros demais na janela é recusado antes
+# de qualquer hash ou leitura do store (attempts.py).
+app.config['ATTEMPTS_WINDOW'] = int(os.getenv('ATTEMPTS_WINDOW', 900))
+app.config['ATTEMPTS_MAX_FAILURES'] = int(os.getenv('ATTEMPTS_MAX_FAILURES', 5))
+app.config['ATTEMPTS_LOCKOUT'] = int(os.getenv('ATTEMPTS_LOCKOUT', 60))
+app.config['ATTEMPTS_MAX_LOCKOUT'] = int(os.getenv('ATTEMPTS_MAX_LOCKOUT', 3600))
+app.config['ATTEMPTS_IP_LIMIT'] = int(os.getenv('ATTEMPTS_IP_LIMIT', 50))
+attempts = AttemptTracker(shared, window=app.config['ATTEMPTS_WINDOW'],
+                          max_failures=app.config['ATTEMPTS_MAX_FAILURES'],
+                          lockout=app.config['ATTEMPTS_LOCKOUT'],
+                          max_lockout=app.config['ATTEMPTS_MAX_LOCKOUT'],
+                          ip_limit=app.config['ATTEMPTS_IP_LIMIT'], events=events)
+
+# --- Códigos de verificação ---
+# Códigos de seis dígitos por propósito e e-mail, com validade, limite de
+# tentativas e limite de envios por e-mail e por IP.
+app.config['CODE_TTL'] = int(os.getenv('CODE_TTL', 600))
+app.config['CODE_MAX_ATTEMPTS'] = int(os.getenv('CODE_MAX_ATTEMPTS', 5))
+codes = VerificationCodes(ttl=app.config['CODE_TTL'], max_attempts=app.config['CODE_MAX_ATTEMPTS'],
+                          backend=shared, attempts=attempts)
+
+@app.errorhandler(RateLimited)
+def rate_limited(e):
+    if request.endpoint == 'cadastro':
+        return redirect(url_for('cadastro', error='rate_limited'))
+    if request.endpoint == 'index':
+        return redirect(url_for('index', error='too_many_attempts', retry=max(1, round(e.retry_after))))
+    response = jsonify({'success': False, 'error': 'rate_limited', 'retry_after': round(e.retry_after)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, round(e.retry_after)))
+    return response
+
+@metrics.REGISTRY.collector
+def app_stats():
+    samples = []
+    for name, value in users.stats().items():
+        samples.append((f'nuks_user_store_{name}', 'gauge', {}, value))
+    for name, value in pages.stats().items():
+        samples.append((f'nuks_render_cache_{name}', 'gauge', {}, value))
+    samples.append(('nuks_mail_queue_pending', 'gauge', {}, mailer.pending()))
+    samples.append(('nuks_hash_rejected_total', 'counter', {}, hasher.rejected))
+    samples.append(('nuks_hash_timeouts_total', 'counter', {}, hasher.timeouts))
+    samples.append(('nuks_verification_codes_active', 'gauge', {}, len(codes)))
+    for name, value in attempts.stats().items():
+        samples.append((f'nuks_attempts_{name}', 'gauge', {}, value))
+    for name, value in events.stats().items():
+        samples.append((f'nuks_event_log_{name}', 'gauge', {}, value))
+    for name, value in feed.stats().items():
+        samples.append((f'nuks_feed_{name}', 'gauge', {}, value))
+    for artifact, counts in downloads.stats().items():
+        for kind, value in counts.items():
+            samples.append(('nuks_downloads_total', 'counter', {'artifact': artifact, 'kind': kind}, value))
+    return samples
+
+@app.cli.command('migrate-users')
+def migrate_users_command():
+    # Grava direto no backend: os wrappers (cache, índice de busca) não
+    # atualizam contas que já existem. Servidores rodando veem a mudança
+    # pela verificação de versão do cache.
+    store = create_store(app.config, shared, cache=False)
     try:
-        with open(USERS_FILE, 'r') as f: return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError): return {}
-
-def save_users(users):
-    with open(USERS_FILE, 'w') as f: json.dump(users, f, indent=4)
+        total = migrate_json(app.config['USERS_FILE'], store)
+    finally:
+        store.close()
+    print(f'{total} usuários importados ou atualizados de {app.config["USERS_FILE"]}')
+
+@app.cli.command('feed-publish')
+@click.option('--kind', type=click.Choice(FEED_KINDS), required=True)
+@click.option('--title', required=True)
+@click.option('--body', default='')
+@click.option('--url')
+@click.option('--image', help='arquivo em Imagens/')
+def feed_publish_command(kind, title, body, url, image):
+    item_id = feed.publish(kind, title, body, url=url, image=image)
+    print(f'Item {item_id} publicado')
+
+@app.cli.command('feed-retract')
+@click.argument('item_id', type=int)
+def feed_retract_command(item_id):
+    if feed.retract(item_id):
+        print(f'Item {item_id} retirado')
+    else:
+        print(f'Item {item_id} não existe')
+
+@app.cli.command('events')
+@click.option('--since', type=click.DateTime(), help='início (hora local)')
+@click.option('--until', type=click.DateTime(), help='fim, exclusivo (hora local)')
+@click.option('--type', 'types', multiple=True, help='tipo de evento; pode repetir')
+@click.option('--email')
+@click.option('--limit', type=int, default=0, help='0 = sem limite')
+def events_command(since, until, types, email, limit):
+    # Uma linha JSON por evento, em ordem de tempo.
+    shown = 0
+    for _, line, _ in query_events(app.config['EVENT_LOG_DIR'],
+                                   since=since.timestamp() if since else None,
+                                   until=until.timestamp() if until else None,
+                                   types=types, match={'email': email} if email else None):
+        click.echo(line.decode('utf-8').rstrip('\n'))
+        shown += 1
+        if limit and shown >= limit:
+            break
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         email = request.form['email']
         senha = request.form['senha']
-        users = load_users()
+        # IP ou conta bloqueados: recusa antes do store e do hash.
+        attempts.check('login', email, request.remote_addr)
         user_data = users.get(email)
         
         # LÓGICA DE ERRO ATUALIZADA
         if not user_data:
             # Caso 1: Email não existe no banco de dados
+            attempts.failure('login', email, request.remote_addr)
+            events.record('login_failed', email=email, ip=request.remote_addr, reason='email_not_found')
             return redirect(url_for('index', error='email_not_found'))
-        elif not check_password_hash(user_data['password_hash'], senha):
+        elif not hasher.verify(user_data['password_hash'], senha):
             # Caso 2: Senha está incorreta
+            attempts.failure('login', email, request.remote_addr)
+            events.record('login_failed', email=email, ip=request.remote_addr, reason='wrong_password')
             return redirect(url_for('index', error='wrong_password'))
         else:
             # Caso 3: Sucesso no login
+            attempts.success('login', email)
+            if hasher.needs_rehash(user_data['password_hash']):
+                try:
+                    users.update_field(email, 'password_hash', hasher.hash(senha))
+                except HasherBusy:
+                    pass
+            regenerate_session()
             session['logged_in'] = True
             session['usuario'] = user_data['username']
             session['email'] = email
+            events.record('login', email=email, ip=request.remote_addr)
             return redirect(url_for('home'))
             
     session.pop('temp_user', None)
-    session.pop('codigo_confirmacao', None)
     error = request.args.get('error')
-    return render_template('Public/login.html', error=error)
+    return pages.render('Public/login.html', error=error)
 
 @app.route('/cadastro', methods=['GET', 'POST'])
 def cadastro():
@@ -68,31 +394,26 @@ def cadastro():
         usuario = request.form['usuario']
         email = request.form['email']
         senha = request.form['senha']
-        users = load_users()
 
         if len(senha) < 6:
             return redirect(url_for('cadastro', error='password_too_short'))
 
-        if email in users:
+        if users.exists(email):
             return redirect(url_for('cadastro', error='email_exists'))
 
-        codigo = str(random.randint(100000, 999999))
-        
-        try:
-            msg = Message('Seu código de confirmação NuksEdition', recipients=[email])
-            msg.body = f'Olá {usuario}, seu código de confirmação é: {codigo}'
-            mail.send(msg)
-        except Exception as e:
-            return "Ocorreu um erro ao enviar o e-mail de confirmação.", 500
+        # A sessão fica no servidor (disco): só o hash da senha vai nela.
+        password_hash = hasher.hash(senha)
+        codigo = codes.issue('cadastro', email, request.remote_addr)
+        ticket = enviar_email('cadastro', email, usuario=usuario, codigo=codigo)
 
         # A conta NÃO é salva aqui. Os dados ficam temporários na sessão.
-        session['temp_user'] = {'usuario': usuario, 'email': email, 'senha': senha}
-        session['codigo_confirmacao'] = codigo
+        session['temp_user'] = {'usuario': usuario, 'email': email, 'password_hash': password_hash}
+        session['mail_ticket'] = ticket
         
         return redirect(url_for('confirmar'))
 
     error = request.args.get('error')
-    return render_template('Public/cadastro.html', error=error)
+    return pages.render('Public/cadastro.html', error=error)
 
 @app.route('/confirmar')
 def confirmar():
@@ -100,7 +421,9 @@ def confirmar():
         return redirect(url_for('cadastro'))
     temp_user = session.get('temp_user', {})
     email = temp_user.get('email')
-    return render_template('Public/confirmar.html', email=email)
+    # O ticket muda a cada cadastro: renderiza sem guardar no cache.
+    return pages.render('Public/confirmar.html', private=True, cache=False, email=email,
+                        ticket=session.get('mail_ticket'))
 
 @app.route('/verificar-codigo', methods=['POST'])
 def verificar_codigo():
@@ -108,29 +431,28 @@ def verificar_codigo():
     if not data:
         return jsonify({'success': False, 'error': 'Invalid request'})
     codigo_digitado = data.get('codigo')
-    codigo_sessao = session.get('codigo_confirmacao')
+    temp_user = session.get('temp_user')
+    # Cadastros iniciados antes da troca ainda têm 'senha' em vez do hash.
+    if not temp_user or 'password_hash' not in temp_user:
+        return jsonify({'success': False, 'error': 'session_expired'})
 
-    if codigo_digitado == codigo_sessao:
-        temp_user = session.get('temp_user')
-        if not temp_user:
-            return jsonify({'success': False, 'error': 'session_expired'})
-
-        users = load_users()
-        
-        # É SOMENTE AQUI que a conta é criada e salva no arquivo.
+    if codes.check('cadastro', temp_user['email'], codigo_digitado, request.remote_addr):
+        # É SOMENTE AQUI que a conta é criada e salva no banco.
         user_id = str(uuid.uuid4())
         creation_date = datetime.now().strftime('%d/%m/%Y')
-        hashed_password = generate_password_hash(temp_user['senha'], method='pbkdf2:sha256')
 
-        users[temp_user['email']] = {
+        created = users.insert(temp_user['email'], {
             'id': user_id,
             'username': temp_user['usuario'],
-            'password_hash': hashed_password,
+            'password_hash': temp_user['password_hash'],
             'data_criacao': creation_date
-        }
-        save_users(users)
+        })
+        if not created:
+            return jsonify({'success': False, 'error': 'email_exists'})
+        events.record('signup', email=temp_user['email'], user_id=user_id, ip=request.remote_addr)
 
         session.clear()
+        regenerate_session()
         session['logged_in'] = True
         session['usuario'] = temp_user['usuario']
         session['email'] = temp_user['email']
@@ -147,55 +469,111 @@ def reenviar_codigo():
         usuario = temp_user.get('usuario')
 
         # Gerar novo código
-        novo_codigo = str(random.randint(100000, 999999))
-        session['codigo_confirmacao'] = novo_codigo
+        novo_codigo = codes.issue('cadastro', email, request.remote_addr)
         
         # Enviar e-mail com o novo código
-        try:
-            msg = Message('Seu novo código de confirmação NuksEdition', recipients=[email])
-            msg.body = f'Olá {usuario}, seu novo código de confirmação é: {novo_codigo}'
-            mail.send(msg)
-            return jsonify({'success': True})
-        except Exception as e:
-            return jsonify({'success': False, 'error': 'Failed to send email'})
+        ticket = enviar_email('reenvio', email, usuario=usuario, codigo=novo_codigo)
+        session['mail_ticket'] = ticket
+        return jsonify({'success': True, 'ticket': ticket})
     
     return jsonify({'success': False, 'error': 'Session expired'})
 
+@app.route('/mail-status/<ticket>')
+def mail_status(ticket):
+    info = mailer.status(ticket)
+    if info is None:
+        return jsonify({'success': False, 'error': 'unknown_ticket'}), 404
+    return jsonify({'success': True, 'status': info['status']})
+
 @app.route('/Imagens/<path:filename>')
 def send_image(filename):
+    response = images.serve(filename)
+    if response is not None:
+        return response
     return send_from_directory('Imagens', filename)
 
 # --- Rotas Protegidas ---
 @app.route('/home')
 def home():
     if not session.get('logged_in'): return redirect(url_for('index'))
-    return render_template('protect/home.html', usuario=session.get('usuario'))
+    return pages.render('protect/home.html', private=True, usuario=session.get('usuario'))
+
+def render_feed(kind, titulo):
+    page = feed.page(kind, request.args.get('cursor'), app.config['FEED_PAGE_SIZE'])
+    return pages.render('protect/explorar.html', private=True, usuario=session.get('usuario'),
+                        titulo=titulo, kind=kind, itens=feed.items(page), next_cursor=page.next_cursor,
+                        image_width=app.config['FEED_IMAGE_WIDTH'])
 
 @app.route('/explorar')
 def explorar():
     if not session.get('logged_in'): return redirect(url_for('index'))
-    return render_template('protect/explorar.html', usuario=session.get('usuario'))
+    return render_feed(None, 'Explorar')
+
+@app.route('/jogos')
+def game():
+    if not session.get('logged_in'): return redirect(url_for('index'))
+    return render_feed('game', 'Jogos')
+
+@app.route('/noticias')
+def noticias():
+    if not session.get('logged_in'): return redirect(url_for('index'))
+    return render_feed('news', 'Notícias')
+
+@app.route('/api/feed')
+def api_feed():
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Not logged in'})
+
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in FEED_KINDS:
+        return jsonify({'success': False, 'error': 'unknown_kind'}), 400
+    limit = request.args.get('limit', app.config['FEED_PAGE_SIZE'], type=int)
+    page = feed.page(kind, request.args.get('cursor'), limit)
+    # Variantes da imagem de cada item, como no <picture> do template.
+    width = app.config['FEED_IMAGE_WIDTH']
+    page = page.with_fields({item.id: {'image_urls': images.urls(item.image, width)}
+                             for item in feed.items(page) if item.image})
+
+    # format=ndjson (ou Accept: application/x-ndjson): um item por linha,
+    # enviado em partes; o próximo cursor vai no cabeçalho X-Next-Cursor.
+    ndjson = (request.args.get('format') == 'ndjson' or
+              request.accept_mimetypes.best == 'application/x-ndjson')
+    etag = page.etag + ('-nd' if ndjson else '')
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    elif ndjson:
+        response = app.response_class(page.ndjson_chunks(), mimetype='application/x-ndjson')
+    else:
+        response = app.response_class(page.json_body(), mimetype='application/json')
+    if page.next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(page.next_cursor)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept')
+    return response
 
 @app.route('/download/calculadora')
 def download_calculadora():
     if not session.get('logged_in'): return redirect(url_for('index'))
-    protect_directory = os.path.join(app.root_path, 'protect')
-    return send_from_directory(directory=protect_directory, path='Calculadora.exe', as_attachment=True)
+    return downloads.serve('calculadora')
 
 @app.route('/download_snake_game')
 def download_snake_game():
     if not session.get('logged_in'):
         return redirect(url_for('index'))
-    # O executável deve estar na pasta 'game' para ser baixado
-    game_directory = os.path.join(app.root_path, 'snake', 'game')
-    return send_from_directory(directory=game_directory, path='NuksEdition_Snake.exe', as_attachment=True)
+    return downloads.serve('snake')
+
+@app.route('/download/manifest.json')
+def download_manifest():
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    return jsonify(downloads.manifest())
 
 @app.route('/user')
 def user():
     if not session.get('logged_in'):
         return redirect(url_for('index'))
 
-    users = load_users()
     user_data = users.get(session.get('email'))
 
     if not user_data:
@@ -208,24 +586,29 @@ def user():
 def config():
     if not session.get('logged_in'):
         return redirect(url_for('index'))
-    return render_template('protect/config.html')
+    return pages.render('protect/config.html', private=True)
+
+@app.route('/api/search/users')
+def search_users():
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Not logged in'})
+
+    query = request.args.get('q', '')[:64]
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    results, next_offset = users.search(query, limit, offset)
+    return jsonify({'success': True, 'query': query, 'results': results, 'next_offset': next_offset})
 
 @app.route('/send_delete_code')
 def send_delete_code():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'error': 'Not logged in'})
 
-    codigo = str(random.randint(100000, 999999))
-    session['delete_confirmation_code'] = codigo
     email = session.get('email')
+    codigo = codes.issue('excluir_conta', email, request.remote_addr)
     
-    try:
-        msg = Message('Seu código de confirmação para exclusão de conta NuksEdition', recipients=[email])
-        msg.body = f'Seu código de confirmação para exclusão de conta é: {codigo}'
-        mail.send(msg)
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'error': 'Failed to send email'})
+    ticket = enviar_email('excluir_conta', email, codigo=codigo)
+    return jsonify({'success': True, 'ticket': ticket})
 
 @app.route('/verify_delete_code', methods=['POST'])
 def verify_delete_code():
@@ -236,14 +619,10 @@ def verify_delete_code():
     if not data:
         return jsonify({'success': False, 'error': 'Invalid request'})
     codigo_digitado = data.get('code')
-    codigo_sessao = session.get('delete_confirmation_code')
-
-    if codigo_digitado == codigo_sessao:
-        users = load_users()
-        email = session.get('email')
-        if email in users:
-            del users[email]
-            save_users(users)
+
+    if codes.check('excluir_conta', session.get('email'), codigo_digitado, request.remote_addr):
+        if users.delete(session.get('email')):
+            events.record('account_deleted', email=session.get('email'), ip=request.remote_addr)
         session.clear()
         return jsonify({'success': True})
     else:
@@ -259,17 +638,11 @@ def send_change_email_code():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'error': 'Not logged in'})
 
-    codigo = str(random.randint(100000, 999999))
-    session['change_email_code'] = codigo
     email = session.get('email')
+    codigo = codes.issue('alterar_email', email, request.remote_addr)
     
-    try:
-        msg = Message('Seu código de confirmação para alteração de e-mail NuksEdition', recipients=[email])
-        msg.body = f'Seu código de confirmação para alteração de e-mail é: {codigo}'
-        mail.send(msg)
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'error': 'Failed to send email'})
+    ticket = enviar_email('alterar_email', email, codigo=codigo)
+    return jsonify({'success': True, 'ticket': ticket})
 
 @app.route('/verify_change_email_code', methods=['POST'])
 def verify_change_email_code():
@@ -280,9 +653,8 @@ def verify_change_email_code():
     if not data:
         return jsonify({'success': False, 'error': 'Invalid request'})
     codigo_digitado = data.get('code')
-    codigo_sessao = session.get('change_email_code')
 
-    if codigo_digitado == codigo_sessao:
+    if codes.check('alterar_email', session.get('email'), codigo_digitado, request.remote_addr):
         return jsonify({'success': True})
     else:
         return jsonify({'success': False})
@@ -297,22 +669,15 @@ def send_new_email_code():
         return jsonify({'success': False, 'error': 'Invalid request'})
     new_email = data.get('new_email')
 
-    users = load_users()
-    if new_email in users:
+    if users.exists(new_email):
         return jsonify({'success': False, 'error': 'email_exists'})
 
     session['new_email'] = new_email
 
-    codigo = str(random.randint(100000, 999999))
-    session['new_email_code'] = codigo
+    codigo = codes.issue('novo_email', session.get('email'), request.remote_addr)
     
-    try:
-        msg = Message('Seu código de confirmação para o novo e-mail NuksEdition', recipients=[new_email])
-        msg.body = f'Seu código de confirmação para o novo e-mail é: {codigo}'
-        mail.send(msg)
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'error': 'Failed to send email'})
+    ticket = enviar_email('novo_email', new_email, codigo=codigo)
+    return jsonify({'success': True, 'ticket': ticket})
 
 @app.route('/verify_new_email_code', methods=['POST'])
 def verify_new_email_code():
@@ -323,17 +688,14 @@ def verify_new_email_code():
     if not data:
         return jsonify({'success': False, 'error': 'Invalid request'})
     codigo_digitado = data.get('code')
-    codigo_sessao = session.get('new_email_code')
 
-    if codigo_digitado == codigo_sessao:
-        users = load_users()
+    if codes.check('novo_email', session.get('email'), codigo_digitado, request.remote_addr):
         old_email = session.get('email')
         new_email = session.get('new_email')
 
-        if old_email in users:
-            users[new_email] = users.pop(old_email)
-            save_users(users)
+        if users.rename(old_email, new_email):
             session['email'] = new_email
+            events.record('email_changed', email=new_email, old_email=old_email, ip=request.remote_addr)
 
         return jsonify({'success': True})
     else:
@@ -344,17 +706,11 @@ def send_change_password_code():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'error': 'Not logged in'})
 
-    codigo = str(random.randint(100000, 999999))
-    session['change_password_code'] = codigo
     email = session.get('email')
+    codigo = codes.issue('alterar_senha', email, request.remote_addr)
     
-    try:
-        msg = Message('Seu código de confirmação para alteração de senha NuksEdition', recipients=[email])
-        msg.body = f'Seu código de confirmação para alteração de senha é: {codigo}'
-        mail.send(msg)
-        return jsonify({'success': True})
-    except Exception as e:
-        return jsonify({'success': False, 'error': 'Failed to send email'})
+    ticket = enviar_email('alterar_senha', email, codigo=codigo)
+    return jsonify({'success': True, 'ticket': ticket})
 
 @app.route('/verify_change_password_code', methods=['POST'])
 def verify_change_password_code():
@@ -365,9 +721,8 @@ def verify_change_password_code():
     if not data:
         return jsonify({'success': False, 'error': 'Invalid request'})
     codigo_digitado = data.get('code')
-    codigo_sessao = session.get('change_password_code')
 
-    if codigo_digitado == codigo_sessao:
+    if codes.check('alterar_senha', session.get('email'), codigo_digitado, request.remote_addr):
         return jsonify({'success': True})
     else:
         return jsonify({'success': False})
@@ -385,15 +740,16 @@ def update_password():
     if len(new_password) < 6:
         return jsonify({'success': False, 'error': 'Password too short'})
 
-    users = load_users()
     email = session.get('email')
+    new_hash = hasher.hash(new_password)
 
-    if email in users:
-        users[email]['password_hash'] = generate_password_hash(new_password, method='pbkdf2:sha256')
-        save_users(users)
+    if users.update_field(email, 'password_hash', new_hash):
+        events.record('password_changed', email=email, ip=request.remote_addr)
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'error': 'User not found'})
 
+# python app.py [--workers N] [--port P] [--dev]; veja launcher.py.
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    from launcher import main
+    main(app)
\ No newline at end of file
@@ -0,0 +1,398 @@
+import asyncio
+import io
+import os
+import secrets
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from werkzeug.http import dump_cookie, parse_cookie
+
+import app as nuks
+from async_mail import AsyncMailer
+from hashing import HasherBusy
+from metrics import REQUEST_SECONDS
+from server_session import ServerSession
+import startup
+from verification import RateLimited
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+
+# --- Modo ASGI ---
+# As rotas JSON de verificação (confirmar.html e config.html) passam a maior
+# parte do tempo esperando SMTP, disco e o pool de hash. Aqui elas viram
+# corrotinas: milhares de verificações pendentes custam corrotinas, não
+# threads. URLs e respostas JSON são as mesmas do app Flask; todas as outras
+# rotas continuam no Flask, chamado como WSGI. A sessão no servidor, os
+# códigos, o store e o hasher são os mesmos objetos de app.py.
+#
+#   uvicorn asgi:application
+#
+# O Waitress / app.run continua disponível como antes. O modo ASGI exige
+# sessão no servidor (SESSION_BACKEND sqlite, memory ou shared); com
+# 'cookie' tudo vai para o Flask.
+
+flask_app = nuks.app
+session_interface = nuks.session_interface
+mailer = AsyncMailer(flask_app, nuks.mailer, max_retries=flask_app.config['MAIL_MAX_RETRIES'])
+
+MAX_BODY = 64 * 1024
+
+
+def blocking(fn, *args):
+    # Store, sessões e códigos (SQLite/JSON/Redis) não têm API assíncrona;
+    # rodam no pool de threads padrão do loop.
+    return asyncio.to_thread(fn, *args)
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {k.decode('latin1').lower(): v.decode('latin1') for k, v in scope['headers']}
+        self.remote_addr = scope['client'][0] if scope.get('client') else None
+        self.body = body
+        self.session = None
+
+    def get_json(self):
+        # Mesmo comportamento de request.get_json(silent=True) no Flask.
+        mimetype = self.headers.get('content-type', '').split(';', 1)[0].strip()
+        if mimetype != 'application/json' and not (mimetype.startswith('application/') and mimetype.endswith('+json')):
+            return None
+        try:
+            return flask_app.json.loads(self.body)
+        except ValueError:
+            return None
+
+
+def enviar_email(tipo, destinatario, **dados):
+    with flask_app.app_context():
+        msg = nuks.montar_email(tipo, destinatario, **dados)
+    return mailer.send(msg)
+
+
+# --- Rotas assíncronas ---
+# Espelham as rotas de mesmo nome em app.py e devolvem o payload JSON.
+
+async def verificar_codigo(req):
+    session = req.session
+    data = req.get_json()
+    if not data:
+        return {'success': False, 'error': 'Invalid request'}
+    codigo_digitado = data.get('codigo')
+    temp_user = session.get('temp_user')
+    if not temp_user or 'password_hash' not in temp_user:
+        return {'success': False, 'error': 'session_expired'}
+
+    if not await blocking(nuks.codes.check, 'cadastro', temp_user['email'], codigo_digitado, req.remote_addr):
+        return {'success': False, 'error': 'Código incorreto'}
+
+    user_id = str(uuid.uuid4())
+    created = await blocking(nuks.users.insert, temp_user['email'], {
+        'id': user_id,
+        'username': temp_user['usuario'],
+        'password_hash': temp_user['password_hash'],
+        'data_criacao': datetime.now().strftime('%d/%m/%Y'),
+    })
+    if not created:
+        return {'success': False, 'error': 'email_exists'}
+    nuks.events.record('signup', email=temp_user['email'], user_id=user_id, ip=req.remote_addr)
+
+    session.clear()
+    await blocking(session_interface.regenerate, session)
+    session['logged_in'] = True
+    session['usuario'] = temp_user['usuario']
+    session['email'] = temp_user['email']
+    return {'success': True}
+
+
+async def reenviar_codigo(req):
+    session = req.session
+    if 'temp_user' not in session:
+        return {'success': False, 'error': 'Session expired'}
+    temp_user = session.get('temp_user')
+    email = temp_user.get('email')
+    novo_codigo = await blocking(nuks.codes.issue, 'cadastro', email, req.remote_addr)
+    ticket = enviar_email('reenvio', email, usuario=temp_user.get('usuario'), codigo=novo_codigo)
+    session['mail_ticket'] = ticket
+    return {'success': True, 'ticket': ticket}
+
+
+def _send_code(purpose):
+    async def handler(req):
+        if not req.session.get('logged_in'):
+            return {'success': False, 'error': 'Not logged in'}
+        email = req.session.get('email')
+        codigo = await blocking(nuks.codes.issue, purpose, email, req.remote_addr)
+        return {'success': True, 'ticket': enviar_email(purpose, email, codigo=codigo)}
+    return handler
+
+
+def _verify_code(purpose, on_success=None):
+    async def handler(req):
+        session = req.session
+        if not session.get('logged_in'):
+            return {'success': False, 'error': 'Not logged in'}
+        data = req.get_json()
+        if not data:
+            return {'success': False, 'error': 'Invalid request'}
+        if not await blocking(nuks.codes.check, purpose, session.get('email'), data.get('code'), req.remote_addr):
+            return {'success': False}
+        if on_success is not None:
+            await on_success(req)
+        return {'success': True}
+    return handler
+
+
+async def _delete_account(req):
+    session = req.session
+    if await blocking(nuks.users.delete, session.get('email')):
+        nuks.events.record('account_deleted', email=session.get('email'), ip=req.remote_addr)
+    session.clear()
+
+
+async def _rename_account(req):
+    session = req.session
+    old_email, new_email = session.get('email'), session.get('new_email')
+    if await blocking(nuks.users.rename, old_email, new_email):
+        session['email'] = new_email
+        nuks.events.record('email_changed', email=new_email, old_email=old_email, ip=req.remote_addr)
+
+
+async def send_new_email_code(req):
+    session = req.session
+    if not session.get('logged_in'):
+        return {'success': False, 'error': 'Not logged in'}
+    data = req.get_json()
+    if not data:
+        return {'success': False, 'error': 'Invalid request'}
+    new_email = data.get('new_email')
+    if await blocking(nuks.users.exists, new_email):
+        return {'success': False, 'error': 'email_exists'}
+
+    session['new_email'] = new_email
+    codigo = await blocking(nuks.codes.issue, 'novo_email', session.get('email'), req.remote_addr)
+    return {'success': True, 'ticket': enviar_email('novo_email', new_email, codigo=codigo)}
+
+
+async def update_password(req):
+    session = req.session
+    if not session.get('logged_in'):
+        return {'success': False, 'error': 'Not logged in'}
+    data = req.get_json()
+    if not data:
+        return {'success': False, 'error': 'Invalid request'}
+    new_password = data.get('new_password')
+    if len(new_password) < 6:
+        return {'success': False, 'error': 'Password too short'}
+
+    new_hash = await nuks.hasher.hash_async(new_password)
+    if await blocking(nuks.users.update_field, session.get('email'), 'password_hash', new_hash):
+        nuks.events.record('password_changed', email=session.get('email'), ip=req.remote_addr)
+        return {'success': True}
+    return {'success': False, 'error': 'User not found'}
+
+
+HANDLERS = {
+    'verificar_codigo': verificar_codigo,
+    'reenviar_codigo': reenviar_codigo,
+    'send_delete_code': _send_code('excluir_conta'),
+    'verify_delete_code': _verify_code('excluir_conta', _delete_account),
+    'send_change_email_code': _send_code('alterar_email'),
+    'verify_change_email_code': _verify_code('alterar_email'),
+    'send_new_email_code': send_new_email_code,
+    'verify_new_email_code': _verify_code('novo_email', _rename_account),
+    'send_change_password_code': _send_code('alterar_senha'),
+    'verify_change_password_code': _verify_code('alterar_senha'),
+    'update_password': update_password,
+}
+
+# As URLs e métodos vêm do url_map do Flask, então as duas versões não
+# divergem.
+ROUTES = {}
+if session_interface is not None:
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint in HANDLERS:
+            ROUTES[rule.rule] = (rule.endpoint, rule.methods - {'HEAD', 'OPTIONS'})
+else:
+    flask_app.logger.warning('SESSION_BACKEND=cookie: o modo ASGI repassa todas as rotas ao Flask.')
+
+
+# --- Sessão ---
+
+async def load_session(req_headers):
+    cookies = parse_cookie(req_headers.get('cookie', ''))
+    sid = cookies.get(session_interface.get_cookie_name(flask_app))
+    if sid:
+        entry = await blocking(session_interface.store.get, sid)
+        if entry is not None:
+            expires, data = entry
+            return ServerSession(data, sid=sid, expires=expires)
+    return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+
+async def save_session(session, headers):
+    action = await blocking(session_interface.persist, flask_app, session)
+    if action is None:
+        return
+    app, si = flask_app, session_interface
+    options = dict(domain=si.get_cookie_domain(app), path=si.get_cookie_path(app),
+                   secure=si.get_cookie_secure(app), httponly=si.get_cookie_httponly(app),
+                   samesite=si.get_cookie_samesite(app))
+    name = si.get_cookie_name(app)
+    if action == 'delete':
+        cookie = dump_cookie(name, '', max_age=0, expires=0, **options)
+    else:
+        cookie = dump_cookie(name, session.sid, expires=si.get_expiration_time(app, session), **options)
+        headers.append((b'vary', b'Cookie'))
+    headers.append((b'set-cookie', cookie.encode('latin1')))
+
+
+# --- Aplicação ASGI ---
+
+async def read_body(receive, limit=None):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def send_json(send, payload, status=200, headers=None):
+    # Mesmo formato do jsonify (compacto, chaves ordenadas).
+    body = (flask_app.json.dumps(payload, separators=(',', ':')) + '\n').encode()
+    headers = [(b'content-type', b'application/json'),
+               (b'content-length', str(len(body)).encode())] + (headers or [])
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def handle(scope, receive, send, endpoint):
+    start = time.perf_counter()
+    body = await read_body(receive, MAX_BODY)
+    if body is None:
+        await send_json(send, {'success': False, 'error': 'Request too large'}, 413)
+        return
+    req = Request(scope, body)
+    req.session = await load_session(req.headers)
+
+    headers = []
+    status = 200
+    try:
+        payload = await HANDLERS[endpoint](req)
+    except RateLimited as e:
+        status = 429
+        payload = {'success': False, 'error': 'rate_limited', 'retry_after': round(e.retry_after)}
+        headers.append((b'retry-after', str(max(1, round(e.retry_after))).encode()))
+    except HasherBusy:
+        status = 503
+        payload = {'success': False, 'error': 'server_busy'}
+        headers.append((b'retry-after', b'1'))
+
+    await save_session(req.session, headers)
+    await send_json(send, payload, status, headers)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, req.method, status)
+
+
+async def call_wsgi(scope, receive, send):
+    # Ponte mínima para quando o asgiref não está instalado: o Flask roda no
+    # pool de threads e o corpo da resposta é repassado em pedaços.
+    body = await read_body(receive)
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # O corpo já foi lido inteiro; vale também para requisições chunked.
+    environ['CONTENT_LENGTH'] = str(len(body))
+
+    loop = asyncio.get_running_loop()
+
+    def emit(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [int(status.split(' ', 1)[0]),
+                          [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]]
+
+        result = flask_app(environ, start_response)
+        try:
+            sent_headers = False
+            for chunk in result:
+                if not sent_headers:
+                    emit({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+                    sent_headers = True
+                if chunk:
+                    emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_headers:
+                emit({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+            emit({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    await loop.run_in_executor(None, run)
+
+
+wsgi_fallback = WsgiToAsgi(flask_app) if WsgiToAsgi is not None else call_wsgi
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            startup.prewarm()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await mailer.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http':
+        route = ROUTES.get(scope['path'])
+        if route is not None and scope['method'] in route[1]:
+            return await handle(scope, receive, send, route[0])
+    return await wsgi_fallback(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host=os.getenv('HOST', '127.0.0.1'), port=int(os.getenv('PORT', 8000)))
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from flask import Response, request, url_for
+from markupsafe import Markup, escape
+from werkzeug.wsgi import wrap_file
+
+from file_lock import FileLock
+from group_commit import atomic_write_json
+
+# Só o pacote é importado aqui; PIL.Image (~15 ms) fica para quando há
+# imagens a gerar.
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+
+# --- Pipeline de imagens ---
+# Os PNGs de Imagens/ têm ~1.4 MB cada mas aparecem como ícones de 50-60px.
+# Na inicialização geramos versões redimensionadas (WebP e PNG) com o hash do
+# conteúdo no nome, em Imagens/_build/. Um manifest guarda o que já foi
+# gerado para não refazer o trabalho a cada reinício. Como o nome muda
+# quando o conteúdo muda, as variantes são servidas com cache "immutable".
+# Os templates usam <picture>: o WebP vai num <source> e o <img> aponta
+# para o PNG, que é o que navegadores sem WebP carregam.
+# Sem o Pillow instalado, só o original é publicado com nome versionado.
+#
+# Com o launcher pre-fork e FAST_STARTUP cada filho roda o build no seu
+# aquecimento. Um lock em _build/ deixa um processo gerar por vez; os
+# seguintes já encontram o manifest pronto e só registram as variantes.
+
+MIMETYPES = {'png': 'image/png', 'webp': 'image/webp', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+class ImageAssets:
+    def __init__(self, source_dir, widths=(64, 128, 256), formats=('webp', 'png')):
+        self.source_dir = source_dir
+        self.build_dir = os.path.join(source_dir, '_build')
+        self.manifest_path = os.path.join(self.build_dir, 'manifest.json')
+        self.widths = widths
+        self.formats = formats
+        # nome original -> lista de variantes {'file', 'width', 'format'}
+        self.variants = {}
+        # nome versionado -> (caminho, tamanho, mimetype, etag)
+        self.files = {}
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def build(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        with FileLock(os.path.join(self.build_dir, '.build.lock')):
+            self._build_locked()
+
+    def _build_locked(self):
+        manifest = self._load_manifest()
+        new_manifest = {}
+        for name in sorted(os.listdir(self.source_dir)):
+            ext = name.rsplit('.', 1)[-1].lower()
+            source = os.path.join(self.source_dir, name)
+            if ext not in MIMETYPES or not os.path.isfile(source):
+                continue
+            st = os.stat(source)
+            stamp = [st.st_mtime_ns, st.st_size]
+            entry = manifest.get(name)
+            if not entry or entry['stamp'] != stamp or not self._outputs_exist(entry):
+                entry = self._build_one(name, source, stamp)
+            new_manifest[name] = entry
+            self._register(name, source, entry)
+
+        if new_manifest != manifest:
+            atomic_write_json(self.manifest_path, new_manifest)
+
+    def _outputs_exist(self, entry):
+        return all(os.path.exists(os.path.join(self.build_dir, v['file'])) for v in entry['variants'])
+
+    def _build_one(self, name, source, stamp):
+        stem, ext = name.rsplit('.', 1)
+        digest = _digest(source)
+        entry = {'stamp': stamp, 'original': f'{stem}.{digest}.{ext.lower()}', 'width': None, 'variants': []}
+        if PIL is None:
+            return entry
+        from PIL import Image
+
+        with Image.open(source) as img:
+            img.load()
+            entry['width'] = img.width
+            for width in self.widths:
+                if width >= img.width:
+                    continue
+                height = max(1, round(img.height * width / img.width))
+                resized = img.resize((width, height), Image.LANCZOS)
+                for fmt in self.formats:
+                    filename = self._save_variant(resized, stem, width, fmt)
+                    entry['variants'].append({'file': filename, 'width': width, 'format': fmt})
+        return entry
+
+    def _save_variant(self, image, stem, width, fmt):
+        # Temporário com nome único; só o nome final (com o hash) é visível.
+        fd, tmp = tempfile.mkstemp(prefix=f'.{stem}.{width}.', suffix=f'.{fmt}.tmp', dir=self.build_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if fmt == 'webp':
+                    image.save(f, 'WEBP', quality=85, method=6)
+                else:
+                    image.save(f, 'PNG', optimize=True)
+            filename = f'{stem}.{width}.{_digest(tmp)}.{fmt}'
+            os.replace(tmp, os.path.join(self.build_dir, filename))
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        return filename
+
+    def _register(self, name, source, entry):
+        st = os.stat(source)
+        ext = name.rsplit('.', 1)[-1].lower()
+        original = entry['original']
+        self.files[original] = (source, st.st_size, MIMETYPES[ext], original.split('.')[-2])
+        for v in entry['variants']:
+            path = os.path.join(self.build_dir, v['file'])
+            self.files[v['file']] = (path, os.path.getsize(path), MIMETYPES[v['format']], v['file'].split('.')[-2])
+        self.variants[name] = entry
+
+    # --- Helpers para os templates ---
+
+    def _pick(self, name, width, fmt):
+        entry = self.variants.get(name)
+        if entry is None:
+            return name
+        candidates = sorted((v for v in entry['variants'] if v['format'] == fmt), key=lambda v: v['width'])
+        for v in candidates:
+            if v['width'] >= width:
+                return v['file']
+        return entry['original']
+
+    def url(self, name, width, fmt='png'):
+        return url_for('send_image', filename=self._pick(name, width, fmt))
+
+    def srcset(self, name, width, fmt='png'):
+        return ', '.join(
+            f"{url_for('send_image', filename=self._pick(name, width * d, fmt))} {d}x" for d in (1, 2))
+
+    def _extra_formats(self, name):
+        # Formatos além do PNG que foram de fato gerados; sem o Pillow não há
+        # nenhum e o <picture> fica só com o <img>.
+        entry = self.variants.get(name)
+        if entry is None:
+            return []
+        generated = {v['format'] for v in entry['variants']}
+        return [fmt for fmt in self.formats if fmt != 'png' and fmt in generated]
+
+    def sources(self, name, width):
+        return Markup(''.join(
+            f'<source type="{MIMETYPES[fmt]}" srcset="{escape(self.srcset(name, width, fmt))}">'
+            for fmt in self._extra_formats(name)))
+
+    def urls(self, name, width):
+        # O mesmo <picture> em JSON, para o JS montar (API do feed).
+        return {'src': self.url(name, width), 'srcset': self.srcset(name, width),
+                'sources': [{'type': MIMETYPES[fmt], 'srcset': self.srcset(name, width, fmt)}
+                            for fmt in self._extra_formats(name)]}
+
+    def serve(self, filename):
+        info = self.files.get(filename)
+        if info is None:
+            return None
+        path, size, mimetype, etag = info
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(wrap_file(request.environ, open(path, 'rb')), mimetype=mimetype,
+                                direct_passthrough=True)
+            response.content_length = size
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
@@ -0,0 +1,94 @@
+import asyncio
+
+from flask_mail import sanitize_address
+
+from mail_queue import FAILED, SENDING, SENT
+from metrics import span
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+
+# --- Envio de e-mails no modo ASGI ---
+# Com MAIL_TRANSPORT=smtp e o aiosmtplib instalado, cada envio é uma
+# corrotina: a espera pelo servidor SMTP não ocupa thread nenhuma. As
+# conexões ficam num pool pequeno e são reaproveitadas entre envios. O status
+# é registrado nos mesmos tickets da MailQueue, então /mail-status continua
+# funcionando. Sem aiosmtplib (ou com os transportes 'file'/'null') as
+# mensagens vão para a MailQueue de sempre.
+
+class AsyncMailer:
+    def __init__(self, app, queue, max_connections=10, max_retries=3, backoff=1.0):
+        self.app = app
+        self.queue = queue
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.enabled = aiosmtplib is not None and app.config.get('MAIL_TRANSPORT') == 'smtp'
+        self._idle = []
+        self._slots = None
+        self._tasks = set()
+
+    def send(self, msg):
+        if not self.enabled:
+            return self.queue.enqueue(msg)
+        ticket = self.queue.track()
+        task = asyncio.get_running_loop().create_task(self._deliver(ticket, msg))
+        # Guarda a referência até o fim; o loop só mantém referências fracas.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return ticket
+
+    async def _connect(self):
+        config = self.app.config
+        client = aiosmtplib.SMTP(hostname=config['MAIL_SERVER'], port=config['MAIL_PORT'],
+                                 use_tls=config.get('MAIL_USE_SSL', False),
+                                 start_tls=config.get('MAIL_USE_TLS', False))
+        await client.connect()
+        if config.get('MAIL_USERNAME'):
+            await client.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return client
+
+    async def _deliver(self, ticket, msg):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        sender = sanitize_address(msg.sender)
+        recipients = [sanitize_address(r) for r in msg.send_to]
+        data = msg.as_bytes()
+        async with self._slots:
+            for attempt in range(1, self.max_retries + 1):
+                self.queue.set_status(ticket, status=SENDING, attempts=attempt)
+                client = None
+                try:
+                    while self._idle and client is None:
+                        client = self._idle.pop()
+                        if not client.is_connected:
+                            client = None
+                    if client is None:
+                        client = await self._connect()
+                    with span('mail_send'):
+                        await client.sendmail(sender, recipients, data)
+                except Exception as e:
+                    if client is not None:
+                        client.close()
+                    self.app.logger.warning('Falha ao enviar e-mail (tentativa %d): %s', attempt, e)
+                    if attempt == self.max_retries:
+                        self.queue.set_status(ticket, status=FAILED, error=str(e))
+                    else:
+                        await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                self._idle.append(client)
+                self.queue.set_status(ticket, status=SENT)
+                break
+
+    async def aclose(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._idle:
+            client = self._idle.pop()
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
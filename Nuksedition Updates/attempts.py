@@ -0,0 +1,226 @@
+import hashlib
+import ipaddress
+import json
+import secrets
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from shared_backend import LocalBackend
+from verification import RateLimited
+
+
+# --- Tentativas (força bruta) ---
+# Conta as tentativas erradas de login e de código de seis dígitos e barra
+# quem passa do limite antes de qualquer hash de senha ou leitura do store:
+#
+#   check(escopo, email, ip)    levanta RateLimited se o IP ou a conta está
+#                               bloqueado (chamado antes de verificar)
+#   failure(escopo, email, ip)  registra um erro
+#   success(escopo, email)      zera o contador da conta
+#
+# O escopo é 'login' ou o propósito do código ('cadastro', 'excluir_conta',
+# ...). Duas dimensões:
+#
+#   por conta (escopo + email)  contador de janela deslizante no backend
+#                               compartilhado, visto por todos os processos.
+#                               max_failures erros dentro de `window` bloqueiam
+#                               a conta por `lockout` segundos; cada bloqueio
+#                               seguido dobra o prazo, até max_lockout. O
+#                               histórico some strikes_ttl depois do último
+#                               erro.
+#   por IP                      count-min sketch em memória, de tamanho fixo
+#                               (não cresce com o número de IPs), com a mesma
+#                               janela deslizante. Pode superestimar, nunca
+#                               subestima. Cada processo tem o seu, então com
+#                               N processos o limite efetivo fica entre
+#                               ip_limit e N * ip_limit. IPv6 conta por /64.
+#
+# As duas janelas usam o contador deslizante aproximado: a contagem da
+# janela anterior pesa proporcionalmente ao quanto dela ainda está dentro
+# dos últimos `window` segundos. Atualizar custa O(1) e guarda só dois
+# números por chave.
+
+def _sliding(prev, curr, elapsed, window):
+    return prev * (1 - elapsed / window) + curr
+
+
+def _sliding_retry(prev, curr, elapsed, window, limit):
+    # Segundos até a estimativa ficar abaixo do limite, sem novos erros.
+    if curr < limit:
+        return max(0.0, window * (1 - (limit - curr) / prev) - elapsed) if prev else 0.0
+    return (window - elapsed) + window * (1 - limit / curr)
+
+
+class SlidingSketch:
+    def __init__(self, window, width=8192, depth=4):
+        self.window = window
+        self.width = width
+        self.depth = depth
+        # Chave aleatória por processo: ninguém escolhe IPs que colidem de
+        # propósito com o de outra pessoa.
+        self._key = secrets.token_bytes(16)
+        self._epoch = 0
+        self._current = array('I', bytes(4 * width * depth))
+        self._previous = array('I', bytes(4 * width * depth))
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return 2 * self._current.itemsize * len(self._current)
+
+    def _cells(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16, key=self._key).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def _roll(self, now):
+        epoch = int(now // self.window)
+        if epoch == self._epoch:
+            return
+        size = 4 * self.width * self.depth
+        self._previous = self._current if epoch == self._epoch + 1 else array('I', bytes(size))
+        self._current = array('I', bytes(size))
+        self._epoch = epoch
+
+    def _counts(self, cells):
+        return min(self._previous[c] for c in cells), min(self._current[c] for c in cells)
+
+    def add(self, item, now):
+        cells = self._cells(item)
+        with self._lock:
+            self._roll(now)
+            for c in cells:
+                if self._current[c] < 0xFFFFFFFF:
+                    self._current[c] += 1
+
+    def retry_after(self, item, limit, now):
+        # 0 se o item está abaixo do limite.
+        cells = self._cells(item)
+        with self._lock:
+            self._roll(now)
+            prev, curr = self._counts(cells)
+        elapsed = now - self._epoch * self.window
+        if _sliding(prev, curr, elapsed, self.window) < limit:
+            return 0.0
+        return _sliding_retry(prev, curr, elapsed, self.window, limit)
+
+
+def _ip_key(ip):
+    if ip is None or ':' not in ip:
+        return ip
+    try:
+        return str(ipaddress.ip_network(f'{ip}/64', strict=False).network_address)
+    except ValueError:
+        return ip
+
+
+class AttemptTracker:
+    def __init__(self, backend=None, window=900, max_failures=5, lockout=60, max_lockout=3600,
+                 strikes_ttl=86400, ip_limit=50, sketch_width=8192, cache_size=10000, events=None):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.window = window
+        self.max_failures = max_failures
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.strikes_ttl = strikes_ttl
+        self.ip_limit = ip_limit
+        self.events = events
+        self.sketch = SlidingSketch(window, width=sketch_width)
+        # Bloqueios já conhecidos por este processo: recusa sem ir ao backend.
+        self.cache_size = cache_size
+        self._locked = OrderedDict()
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.lockouts = 0
+        self.rejected_ip = 0
+        self.rejected_account = 0
+
+    @staticmethod
+    def _key(scope, subject):
+        # attempts:<escopo>:<email> -> [início da janela, anterior, atual,
+        #                                bloqueado até, bloqueios seguidos]
+        return f'attempts:{scope}:{json.dumps(subject)}'
+
+    def _remember(self, key, until):
+        with self._lock:
+            self._locked[key] = until
+            self._locked.move_to_end(key)
+            while len(self._locked) > self.cache_size:
+                self._locked.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._locked.pop(key, None)
+
+    def check(self, scope, subject, ip=None, now=None):
+        if now is None:
+            now = time.time()
+        ip = _ip_key(ip)
+        if ip is not None:
+            retry_after = self.sketch.retry_after(ip, self.ip_limit, now)
+            if retry_after > 0:
+                self.rejected_ip += 1
+                raise RateLimited(retry_after)
+
+        key = self._key(scope, subject)
+        until = self._locked.get(key)
+        if until is None or until <= now:
+            if until is not None:
+                self._forget(key)
+            current = self.backend.get(key)
+            until = json.loads(current)[3] if current else 0
+            if until > now:
+                self._remember(key, until)
+        if until > now:
+            self.rejected_account += 1
+            raise RateLimited(until - now)
+
+    def failure(self, scope, subject, ip=None, now=None):
+        # Devolve a duração do bloqueio, se este erro bloqueou a conta.
+        if now is None:
+            now = time.time()
+        ip = _ip_key(ip)
+        if ip is not None:
+            self.sketch.add(ip, now)
+        self.failures += 1
+
+        def count(current):
+            start, prev, curr, until, strikes = json.loads(current) if current else (0, 0, 0, 0, 0)
+            if until > now:
+                # Tentativa que passou pelo check() antes do bloqueio valer.
+                return current, None
+            epoch = now // self.window * self.window
+            if epoch != start:
+                prev, curr = (curr if epoch - start == self.window else 0), 0
+                start = epoch
+            curr += 1
+            if _sliding(prev, curr, now - start, self.window) < self.max_failures:
+                return json.dumps([start, prev, curr, until, strikes]), None
+            strikes += 1
+            seconds = min(self.lockout * 2 ** (strikes - 1), self.max_lockout)
+            return json.dumps([start, 0, 0, now + seconds, strikes]), seconds
+
+        key = self._key(scope, subject)
+        seconds = self.backend.update(key, count, ttl=self.strikes_ttl)
+        if seconds is not None:
+            self.lockouts += 1
+            self._remember(key, now + seconds)
+            if self.events is not None:
+                self.events.record('lockout', scope=scope, email=subject, ip=ip, seconds=seconds)
+        return seconds
+
+    def success(self, scope, subject):
+        # Quase sempre não há nada a apagar; uma leitura evita uma escrita no
+        # backend a cada login.
+        key = self._key(scope, subject)
+        self._forget(key)
+        if self.backend.get(key) is not None:
+            self.backend.delete(key)
+
+    def stats(self):
+        return {'failures': self.failures, 'lockouts': self.lockouts, 'rejected_ip': self.rejected_ip,
+                'rejected_account': self.rejected_account, 'locked_cached': len(self._locked),
+                'sketch_bytes': self.sketch.nbytes}
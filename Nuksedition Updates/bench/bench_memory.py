@@ -0,0 +1,113 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+
+from compact_records import compact, materialize
+from generate_users import generate_users
+from user_store import load_users
+
+
+# --- Benchmark de memória dos registros de usuário ---
+# Carrega um NuksEdition.json sintético de duas formas, como dicts (o que o
+# json.load devolve) e como CompactUser (compact_records.py), e mede com
+# tracemalloc quanto cada uma ocupa depois de pronta. Mede também o custo de
+# compactar e de materializar um registro de volta em dict.
+#
+#   python bench/bench_memory.py --users 200000
+#   python bench/bench_memory.py --users 1000000 --output memoria.json
+#
+# Use --hash-method scrypt para medir com hashes maiores.
+
+
+def measure(build):
+    # Memória que sobra alocada depois de build() (em bytes) e o pico. O
+    # tracemalloc deixa tudo bem mais lento, então o tempo vem de outra
+    # execução, sem ele.
+    gc.collect()
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, current, peak, elapsed
+
+
+def per_call_us(fn, items, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    return (time.perf_counter() - start) / (repeat * len(items)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memória dos registros de usuário: dict x CompactUser')
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:260000')
+    parser.add_argument('--output', help='grava o resultado em JSON')
+    parser.add_argument('--workdir', help='diretório de trabalho (padrão: temporário)')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='nuks-bench-mem-')
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, 'NuksEdition.json')
+    generate_users(path, args.users, method=args.hash_method)
+
+    dicts, dict_bytes, dict_peak, dict_s = measure(lambda: load_users(path))
+    del dicts
+    compacted, compact_bytes, compact_peak, compact_s = measure(
+        lambda: {email: compact(user) for email, user in load_users(path).items()})
+
+    # Tudo precisa voltar igual ao original.
+    original = load_users(path)
+    assert all(materialize(compacted[email]) == user for email, user in original.items())
+    sample = list(original.values())[:1000]
+    sample_compact = [compacted[email] for email in list(original)[:1000]]
+    compact_us = per_call_us(compact, sample, 20)
+    materialize_us = per_call_us(materialize, sample_compact, 20)
+    del original
+
+    n = args.users
+    results = {
+        'users': n,
+        'hash_method': args.hash_method,
+        'python': sys.version.split()[0],
+        'dict': {'bytes': dict_bytes, 'bytes_per_user': round(dict_bytes / n), 'peak_bytes': dict_peak,
+                 'load_s': round(dict_s, 3)},
+        'compact': {'bytes': compact_bytes, 'bytes_per_user': round(compact_bytes / n), 'peak_bytes': compact_peak,
+                    'load_s': round(compact_s, 3)},
+        'reduction': round(1 - compact_bytes / dict_bytes, 3),
+        'compact_us': round(compact_us, 2),
+        'materialize_us': round(materialize_us, 2),
+    }
+
+    mb = 1024 * 1024
+    print(f'{n} usuários ({args.hash_method})')
+    for name in ('dict', 'compact'):
+        r = results[name]
+        print(f'  {name:8} {r["bytes"] / mb:9.1f} MB  {r["bytes_per_user"]:5} bytes/usuário  '
+              f'pico {r["peak_bytes"] / mb:9.1f} MB  carga {r["load_s"]:.2f}s')
+    print(f'  redução {results["reduction"] * 100:.1f}%; compactar {results["compact_us"]} us, '
+          f'materializar {results["materialize_us"]} us por registro')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f'Resultado gravado em {args.output}')
+
+
+if __name__ == '__main__':
+    main()
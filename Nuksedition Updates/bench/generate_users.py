@@ -0,0 +1,51 @@
+import argparse
+import json
+import random
+import uuid
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+
+# --- Gerador de usuários sintéticos ---
+# Gera um NuksEdition.json no formato atual com N contas. Todas usam a mesma
+# senha (BENCH_PASSWORD) e o mesmo hash, calculado uma vez só; gerar um
+# pbkdf2 por conta tornaria 1M de usuários inviável.
+#
+#   python bench/generate_users.py 100000 -o /tmp/NuksEdition.json
+
+BENCH_PASSWORD = 'senha-bench-123'
+
+
+def bench_email(i):
+    return f'usuario{i}@bench.nuksedition'
+
+
+def generate_users(path, count, seed=42, method='pbkdf2:sha256'):
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(BENCH_PASSWORD, method)
+    start = date(2024, 1, 1)
+    # Escreve registro a registro para não montar o dicionário inteiro em memória.
+    with open(path, 'w') as f:
+        f.write('{\n')
+        for i in range(count):
+            record = {
+                'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                'username': f'Usuario{i}',
+                'password_hash': password_hash,
+                'data_criacao': (start + timedelta(days=rng.randrange(700))).strftime('%d/%m/%Y'),
+            }
+            sep = ',\n' if i < count - 1 else '\n'
+            f.write(f'    {json.dumps(bench_email(i))}: {json.dumps(record)}{sep}')
+        f.write('}\n')
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera um NuksEdition.json sintético')
+    parser.add_argument('count', type=int)
+    parser.add_argument('-o', '--output', default='NuksEdition.json')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_users(args.output, args.count, args.seed)
+    print(f'{args.count} usuários gravados em {args.output}')
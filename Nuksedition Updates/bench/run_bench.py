@@ -0,0 +1,294 @@
+import argparse
+import functools
+import http.client
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(HERE)
+sys.path.insert(0, APP_DIR)
+
+from generate_users import BENCH_PASSWORD, bench_email, generate_users
+
+
+# --- Benchmark das rotas de conta e páginas ---
+# Gera uma base sintética, sobe o app com transporte de e-mail 'null' e mede
+# latência (p50/p95/p99) e requisições por segundo de cada rota, tanto pelo
+# test client do Flask quanto por um Waitress de verdade. O resultado vai
+# para um JSON; com --baseline o script compara com uma execução anterior e
+# sai com código 1 se alguma rota piorar além da tolerância.
+#
+#   python bench/run_bench.py --users 100000 --output atual.json
+#   python bench/run_bench.py --users 100000 --baseline atual.json
+#
+# Use --hash-method pbkdf2:sha256:1000 para rodadas rápidas; o padrão usa o
+# mesmo custo dos hashes de produção.
+
+ROUTES = ['/', '/verificar-codigo', '/user', '/update_password', '/home', '/explorar']
+
+
+def load_app(workdir, store, hash_method):
+    os.chdir(workdir)
+    os.environ.update({
+        'USER_STORE': store,
+        'USERS_DB': os.path.join(workdir, 'NuksEdition.db'),
+        'FEED_FILE': os.path.join(workdir, 'feed.ndjson'),
+        'MAIL_TRANSPORT': 'null',
+        'SESSION_BACKEND': 'memory',
+        'PASSWORD_HASH_METHOD': hash_method,
+        # Todas as requisições saem do mesmo IP; sem isto os limites de taxa
+        # bloqueariam o próprio benchmark.
+        'ATTEMPTS_IP_LIMIT': str(10 ** 9),
+    })
+    import app as nuks
+    from verification import TokenBucket
+    # Mantém a instância do app (backend compartilhado, contador de
+    # tentativas) e só troca os baldes de envio e de tentativas por IP.
+    codes = nuks.codes
+    unlimited = (10 ** 9, 1)
+    codes.sends_per_email = TokenBucket(*unlimited, backend=codes.backend, name='send_email')
+    codes.sends_per_ip = TokenBucket(*unlimited, backend=codes.backend, name='send_ip')
+    codes.attempts_per_ip = TokenBucket(*unlimited, backend=codes.backend, name='attempt_ip')
+    return nuks
+
+
+# --- Clientes ---
+# Os dois clientes têm a mesma interface: get/post devolvem o status HTTP.
+
+class FlaskClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def get(self, path):
+        return self._client.get(path).status_code
+
+    def post(self, path, data=None, json=None):
+        return self._client.post(path, data=data, json=json).status_code
+
+
+class HttpClient:
+    def __init__(self, host, port):
+        self._conn = http.client.HTTPConnection(host, port, timeout=60)
+        self._cookies = {}
+
+    def _request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self._cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self._cookies.items())
+        self._conn.request(method, path, body=body, headers=headers)
+        response = self._conn.getresponse()
+        response.read()
+        for value in response.headers.get_all('Set-Cookie') or []:
+            name, _, rest = value.partition('=')
+            self._cookies[name] = rest.split(';', 1)[0]
+        return response.status
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, data=None, json=None):
+        if json is not None:
+            import json as _json
+            return self._request('POST', path, _json.dumps(json), {'Content-Type': 'application/json'})
+        return self._request('POST', path, urllib.parse.urlencode(data or {}),
+                             {'Content-Type': 'application/x-www-form-urlencoded'})
+
+
+# --- Cenários ---
+# Cada cenário recebe um cliente e devolve o status da requisição medida. O
+# preparo (login, cadastro) acontece fora do tempo medido.
+
+class Scenarios:
+    def __init__(self, nuks, make_client, users):
+        self.nuks = nuks
+        self.make_client = make_client
+        self.users = users
+        self._signup_seq = 0
+        self._lock = threading.Lock()
+
+    def logged_in_client(self, i):
+        client = self.make_client()
+        client.post('/', data={'email': bench_email(i % self.users), 'senha': BENCH_PASSWORD})
+        return client
+
+    def prepare(self, route, i):
+        if route == '/':
+            return self.make_client()
+        if route == '/verificar-codigo':
+            with self._lock:
+                self._signup_seq += 1
+                email = f'novo{self._signup_seq}-{time.time_ns()}@bench.nuksedition'
+            client = self.make_client()
+            client.post('/cadastro', data={'usuario': 'Novo', 'email': email, 'senha': BENCH_PASSWORD})
+            return client, self.nuks.codes.issue('cadastro', email)
+        return None
+
+    def run(self, route, client, state, i):
+        if route == '/':
+            return state.post('/', data={'email': bench_email(i % self.users), 'senha': BENCH_PASSWORD})
+        if route == '/verificar-codigo':
+            signup_client, code = state
+            return signup_client.post('/verificar-codigo', json={'codigo': code})
+        if route == '/update_password':
+            return client.post('/update_password', json={'new_password': BENCH_PASSWORD})
+        return client.get(route)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def bench_route(scenarios, route, requests, concurrency):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = max(1, requests // concurrency)
+
+    def worker(t):
+        client = scenarios.logged_in_client(t)
+        local, local_errors = [], 0
+        for n in range(per_thread):
+            i = t * per_thread + n
+            state = scenarios.prepare(route, i)
+            start = time.perf_counter()
+            status = scenarios.run(route, client, state, i)
+            local.append(time.perf_counter() - start)
+            if status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def start_waitress(app):
+    from waitress.server import create_server
+    server = create_server(app, host='127.0.0.1', port=0, threads=8)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    return server, server.effective_port
+
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                             capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for mode, routes in results['results'].items():
+        for route, current in routes.items():
+            previous = baseline.get('results', {}).get(mode, {}).get(route)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{mode} {route}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+            if previous['rps'] and current['rps'] < previous['rps'] * (1 - tolerance):
+                regressions.append(f'{mode} {route}: rps {previous["rps"]} -> {current["rps"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das rotas do NuksEdition')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--store', default='sqlite', choices=['sqlite', 'json', 'binary'])
+    parser.add_argument('--mode', default='all', choices=['client', 'waitress', 'all'])
+    parser.add_argument('--requests', type=int, default=200, help='requisições por rota')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--routes', nargs='*', default=ROUTES)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:260000')
+    parser.add_argument('--output', default='bench_result.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--workdir', help='diretório de trabalho (padrão: temporário)')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='nuks-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    generate_users(os.path.join(workdir, 'NuksEdition.json'), args.users, method=args.hash_method)
+    t1 = time.perf_counter()
+    nuks = load_app(workdir, args.store, args.hash_method)
+    t2 = time.perf_counter()
+    print(f'{args.users} usuários gerados em {t1 - t0:.1f}s; app carregado em {t2 - t1:.1f}s ({workdir})')
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'users': args.users,
+            'store': args.store,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'hash_method': args.hash_method,
+            'python': platform.python_version(),
+            'startup_s': round(t2 - t1, 3),
+        },
+        'results': {},
+    }
+
+    modes = ['client', 'waitress'] if args.mode == 'all' else [args.mode]
+    for mode in modes:
+        if mode == 'client':
+            make_client = functools.partial(FlaskClient, nuks.app)
+        else:
+            # O servidor roda numa thread daemon e termina junto com o script.
+            server, port = start_waitress(nuks.app)
+            make_client = functools.partial(HttpClient, '127.0.0.1', port)
+        scenarios = Scenarios(nuks, make_client, args.users)
+        results['results'][mode] = {}
+        for route in args.routes:
+            stats = bench_route(scenarios, route, args.requests, args.concurrency)
+            results['results'][mode][route] = stats
+            print(f'[{mode}] {route:20} {stats["rps"]:>9} req/s  p50 {stats["p50_ms"]:>9}ms  '
+                  f'p95 {stats["p95_ms"]:>9}ms  p99 {stats["p99_ms"]:>9}ms  erros {stats["errors"]}')
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Resultado gravado em {output}')
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print('REGRESSÃO:', line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
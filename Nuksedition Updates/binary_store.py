@@ -0,0 +1,445 @@
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+
+from file_lock import FileLock
+from group_commit import GroupCommitWriter, atomic_write, atomic_write_json
+from metrics import span
+from user_store import USER_FIELDS, UserStore, load_users
+
+
+# --- Formato binário dos usuários ---
+# Alternativa compacta ao NuksEdition.json (USER_STORE=binary). O arquivo é
+# imutável e lido por mmap; nenhum registro é decodificado até ser pedido.
+#
+#   cabeçalho   magic 'NUKSUSR1', ordem dos bytes, nº de registros e onde
+#               terminam os registros e começam os dois índices
+#   registros   5 comprimentos uint16 + email, id, username, password_hash e
+#               data_criacao em UTF-8, um após o outro
+#   índices     por email e por id: hashes de 8 bytes (blake2b) ordenados,
+#               seguidos dos offsets dos registros na mesma ordem
+#
+# Uma leitura é um bisect sobre o array de hashes (feito pelo mmap, sem
+# copiar o índice para a memória) e a decodificação de um único registro.
+# A memória do processo não cresce com o número de usuários; as páginas do
+# arquivo ficam no cache do sistema, compartilhadas entre os processos.
+#
+# As escritas vão para um diário NDJSON (<arquivo>.journal) que fica em
+# memória por cima do arquivo base. A cada compact_every alterações o base
+# é regravado com o diário incorporado e o diário é apagado. Um lock de
+# arquivo serializa as escritas entre processos; os outros processos veem as
+# alterações lendo o fim do diário (no máximo a cada check_interval).
+#
+# Conversão nos dois sentidos:
+#   python binary_store.py to-binary NuksEdition.json NuksEdition.nukb
+#   python binary_store.py to-json NuksEdition.nukb NuksEdition.json
+
+MAGIC = b'NUKSUSR1'
+HEADER = struct.Struct('<8sB3xIQQQ')
+LENGTHS = struct.Struct('<5H')
+BYTE_ORDER = 1 if sys.byteorder == 'little' else 2
+
+
+def key_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _encode(email, record):
+    values = [email.encode('utf-8')] + [str(record[f]).encode('utf-8') for f in USER_FIELDS]
+    if max(len(v) for v in values) > 0xFFFF:
+        raise ValueError('campo grande demais para o formato binário')
+    return LENGTHS.pack(*(len(v) for v in values)) + b''.join(values)
+
+
+def _align(f):
+    # Os índices são lidos com memoryview.cast('Q'): começam alinhados a 8.
+    pad = -f.tell() % 8
+    if pad:
+        f.write(b'\0' * pad)
+
+
+def write_binary(path, items):
+    # items: (email, registro). Os registros são gravados conforme chegam;
+    # só os hashes e offsets ficam em memória até o fim.
+    def write(f):
+        f.write(b'\0' * HEADER.size)
+        by_email = []
+        by_id = []
+        for email, record in items:
+            offset = f.tell()
+            f.write(_encode(email, record))
+            by_email.append((key_hash(email), offset))
+            by_id.append((key_hash(record['id']), offset))
+        records_end = f.tell()
+        index_offsets = []
+        for entries in (by_email, by_id):
+            entries.sort()
+            _align(f)
+            index_offsets.append(f.tell())
+            array('Q', (h for h, _ in entries)).tofile(f)
+            array('Q', (o for _, o in entries)).tofile(f)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, BYTE_ORDER, len(by_email), records_end, *index_offsets))
+
+    with span('store_save'):
+        atomic_write(path, write, mode='wb')
+
+
+class _BaseFile:
+    # Um arquivo base mapeado. Nunca é fechado explicitamente: leitores
+    # podem estar usando a versão antiga enquanto outra é mapeada; o mmap
+    # some quando ninguém mais a referencia.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, order, count, records_end, email_index, id_index = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} não é um arquivo de usuários NuksEdition')
+        if order != BYTE_ORDER:
+            raise ValueError(f'{path} foi gerado em outra arquitetura; converta de novo a partir do JSON')
+        self.count = count
+        self.records_end = records_end
+        view = memoryview(self._mm)
+        size = count * 8
+        self._email_hashes = view[email_index:email_index + size].cast('Q')
+        self._email_offsets = view[email_index + size:email_index + 2 * size].cast('Q')
+        self._id_hashes = view[id_index:id_index + size].cast('Q')
+        self._id_offsets = view[id_index + size:id_index + 2 * size].cast('Q')
+
+    def _read(self, offset):
+        lengths = LENGTHS.unpack_from(self._mm, offset)
+        pos = offset + LENGTHS.size
+        values = []
+        for length in lengths:
+            values.append(self._mm[pos:pos + length].decode('utf-8'))
+            pos += length
+        return values[0], dict(zip(USER_FIELDS, values[1:])), pos
+
+    def _candidates(self, hashes, offsets, h):
+        i = bisect.bisect_left(hashes, h)
+        while i < self.count and hashes[i] == h:
+            yield offsets[i]
+            i += 1
+
+    def find_email(self, email):
+        for offset in self._candidates(self._email_hashes, self._email_offsets, key_hash(email)):
+            found, record, _ = self._read(offset)
+            if found == email:
+                return record
+        return None
+
+    def find_id(self, user_id):
+        for offset in self._candidates(self._id_hashes, self._id_offsets, key_hash(user_id)):
+            email, record, _ = self._read(offset)
+            if record['id'] == user_id:
+                return email, record
+        return None
+
+    def __iter__(self):
+        pos = HEADER.size
+        while pos < self.records_end:
+            email, record, pos = self._read(pos)
+            yield email, record
+
+
+class _State:
+    # Base mapeado + alterações do diário. Trocado inteiro a cada recarga,
+    # então um leitor que pegou self._state vê sempre um estado coerente.
+    def __init__(self, base):
+        self.base = base
+        self.overlay = {}
+        self.overlay_ids = {}
+        self.count = base.count
+        self.journal_offset = 0
+        self.journal_stamp = None
+        self.journal_entries = 0
+
+    def lookup(self, email):
+        if email in self.overlay:
+            return self.overlay[email]
+        return self.base.find_email(email)
+
+    def apply(self, op):
+        email = op['email']
+        old = self.lookup(email)
+        previous = self.overlay.get(email)
+        if previous is not None:
+            self.overlay_ids.pop(previous['id'], None)
+        if op['op'] == 'put':
+            user = {f: op['user'][f] for f in USER_FIELDS}
+            self.overlay[email] = user
+            self.overlay_ids[user['id']] = email
+            self.count += old is None
+        else:
+            self.overlay[email] = None
+            self.count -= old is not None
+        self.journal_entries += 1
+
+
+class _Batch:
+    # O que as funções do group commit enxergam: o estado atual mais as
+    # alterações já feitas no mesmo lote.
+    def __init__(self, state):
+        self.state = state
+        self.changes = {}
+        self.ops = []
+
+    def get(self, email):
+        if email in self.changes:
+            return self.changes[email]
+        return self.state.lookup(email)
+
+    def put(self, email, record):
+        self.changes[email] = record
+        self.ops.append({'op': 'put', 'email': email, 'user': record})
+
+    def delete(self, email):
+        self.changes[email] = None
+        self.ops.append({'op': 'del', 'email': email})
+
+
+class BinaryUserStore(UserStore):
+    def __init__(self, path, check_interval=1.0, compact_every=5000):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.check_interval = check_interval
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + '.lock')
+        self._writer = GroupCommitWriter(self._begin_batch, self._commit_batch, finish=self._file_lock.release)
+        self._checked_at = 0.0
+        self.remaps = 0
+        self.compactions = 0
+        if not os.path.exists(path):
+            with self._file_lock:
+                if not os.path.exists(path):
+                    write_binary(path, [])
+        with self._lock:
+            self._reload()
+
+    # --- Estado em memória ---
+
+    def _reload(self):
+        state = _State(_BaseFile(self.path))
+        self._read_journal(state)
+        self._state = state
+        self.remaps += 1
+
+    def _read_journal(self, state):
+        # Aplica o que foi acrescentado ao diário desde a última leitura.
+        # Devolve False se o diário foi trocado e é preciso recarregar.
+        try:
+            st = os.stat(self.journal_path)
+        except FileNotFoundError:
+            return state.journal_stamp is None
+        stamp = (st.st_ino, st.st_size)
+        if stamp == state.journal_stamp:
+            return True
+        if state.journal_stamp is not None and (st.st_ino != state.journal_stamp[0] or st.st_size < state.journal_offset):
+            return False
+        with open(self.journal_path, 'rb') as f:
+            f.seek(state.journal_offset)
+            data = f.read()
+        # Uma linha sem '\n' ainda está sendo escrita; fica para a próxima.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                state.apply(json.loads(line))
+        state.journal_offset += end
+        state.journal_stamp = (st.st_ino, state.journal_offset) if end < len(data) else stamp
+        return True
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            # Diário antes do base: se o base mudou no meio, _reload relê o
+            # diário novo (ou a falta dele) e o estado fica consistente.
+            if not self._read_journal(self._state):
+                self._reload()
+                return
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if (st.st_ino, st.st_mtime_ns, st.st_size) != self._state.base.stamp:
+                self._reload()
+
+    # --- Leitura ---
+
+    def get(self, email):
+        self._refresh()
+        user = self._state.lookup(email)
+        return dict(user) if user else None
+
+    def get_by_id(self, user_id):
+        self._refresh()
+        state = self._state
+        email = state.overlay_ids.get(user_id)
+        if email is not None:
+            user = state.overlay.get(email)
+            if user is not None and user['id'] == user_id:
+                return email, dict(user)
+        found = state.base.find_id(user_id)
+        if found is None:
+            return None
+        email, user = found
+        if email in state.overlay:
+            # O registro do base foi alterado ou apagado pelo diário.
+            user = state.overlay[email]
+            return (email, dict(user)) if user is not None and user['id'] == user_id else None
+        return email, user
+
+    def all(self):
+        self._refresh()
+        state = self._state
+        overlay = dict(state.overlay)
+        for email, user in state.base:
+            if email not in overlay:
+                yield email, user
+        for email, user in overlay.items():
+            if user is not None:
+                yield email, dict(user)
+
+    def count(self):
+        self._refresh()
+        return self._state.count
+
+    def version(self):
+        try:
+            journal = os.stat(self.journal_path).st_size
+        except FileNotFoundError:
+            journal = 0
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, journal)
+
+    # --- Escrita ---
+
+    def _begin_batch(self):
+        self._file_lock.acquire()
+        self._refresh(force=True)
+        return _Batch(self._state)
+
+    def _commit_batch(self, batch):
+        if not batch.ops:
+            return
+        data = b''.join(json.dumps(op, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                        for op in batch.ops)
+        with span('store_save'):
+            fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        with self._lock:
+            if not self._read_journal(self._state):
+                self._reload()
+            if self._state.journal_entries >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        # Chamado com o lock de arquivo: incorpora o diário num base novo.
+        # all() lê do mmap antigo enquanto o novo é gravado ao lado.
+        write_binary(self.path, self.all())
+        os.remove(self.journal_path)
+        self.compactions += 1
+        self._reload()
+
+    def compact(self):
+        with self._file_lock, self._lock:
+            self._refresh(force=True)
+            if self._state.journal_entries:
+                self._compact()
+
+    def insert(self, email, record):
+        def fn(batch):
+            if batch.get(email) is not None:
+                return False
+            batch.put(email, {f: record[f] for f in USER_FIELDS})
+            return True
+        return self._writer.submit(fn)
+
+    def update_field(self, email, field, value):
+        if field not in USER_FIELDS:
+            raise ValueError(f'Campo desconhecido: {field}')
+        def fn(batch):
+            user = batch.get(email)
+            if user is None:
+                return False
+            batch.put(email, dict(user, **{field: value}))
+            return True
+        return self._writer.submit(fn)
+
+    def rename(self, old_email, new_email):
+        def fn(batch):
+            user = batch.get(old_email)
+            if user is None or batch.get(new_email) is not None:
+                return False
+            batch.delete(old_email)
+            batch.put(new_email, user)
+            return True
+        return self._writer.submit(fn)
+
+    def delete(self, email):
+        def fn(batch):
+            if batch.get(email) is None:
+                return False
+            batch.delete(email)
+            return True
+        return self._writer.submit(fn)
+
+    def stats(self):
+        state = self._state
+        stats = {'binary_base_records': state.base.count, 'binary_journal_entries': state.journal_entries,
+                 'binary_compactions': self.compactions, 'binary_remaps': self.remaps}
+        stats.update(self._writer.stats())
+        return stats
+
+
+# --- Conversão ---
+
+def json_to_binary(json_path, binary_path):
+    users = load_users(json_path)
+    write_binary(binary_path, ((email, {f: user[f] for f in USER_FIELDS}) for email, user in users.items()))
+    return len(users)
+
+
+def binary_to_json(binary_path, json_path):
+    # Inclui as alterações do diário que ainda não foram compactadas.
+    store = BinaryUserStore(binary_path)
+    users = dict(store.all())
+    atomic_write_json(json_path, users)
+    return len(users)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Converte a base de usuários entre JSON e o formato binário')
+    parser.add_argument('direction', choices=('to-binary', 'to-json'))
+    parser.add_argument('source')
+    parser.add_argument('dest')
+    args = parser.parse_args(argv)
+    if args.direction == 'to-binary':
+        total = json_to_binary(args.source, args.dest)
+    else:
+        total = binary_to_json(args.source, args.dest)
+    print(f'{total} usuários gravados em {args.dest}')
+
+
+if __name__ == '__main__':
+    main()
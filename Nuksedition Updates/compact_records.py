@@ -0,0 +1,187 @@
+import sys
+from datetime import date
+
+
+# --- Registros compactos em memória ---
+# Quando muitos usuários ficam em memória (cópia do NuksEdition.json no
+# JsonUserStore, LRU do CachedUserStore), cada conta como dict com quatro
+# strings custa ~550 bytes. CompactUser guarda o mesmo conteúdo em ~250:
+#
+#   id             16 bytes do UUID
+#   password_hash  método interned ('pbkdf2:sha256:600000', compartilhado
+#                  por todas as contas) + sal e digest em bytes
+#   data_criacao   ordinal do dia (int, também compartilhado)
+#
+# O UUID, o sal e o digest ficam num único bytes (_blob) para pagar o
+# cabeçalho de objeto uma vez só. Nada é perdido: to_dict() devolve
+# exatamente as strings originais, e só quando alguém pede. Campos que não
+# seguem o formato esperado ficam como vieram; registros com id que não é
+# UUID continuam dicts (compact() devolve uma cópia).
+
+FIELDS = frozenset(('id', 'username', 'password_hash', 'data_criacao'))
+
+# Poucas datas distintas (uma por dia de cadastro): os dois sentidos da
+# conversão ficam em cache e cada ordinal é um único objeto int.
+_ORDINALS = {}
+_DATES = {}
+
+
+def _pack_date(text):
+    # 'dd/mm/YYYY' -> ordinal; qualquer outra coisa fica como string.
+    value = _ORDINALS.get(text)
+    if value is not None:
+        return value
+    try:
+        day, month, year = text.split('/')
+        value = date(int(year), int(month), int(day)).toordinal()
+    except (AttributeError, ValueError):
+        return text
+    if date.fromordinal(value).strftime('%d/%m/%Y') != text:
+        return text
+    _ORDINALS[text] = value
+    _DATES[value] = text
+    return value
+
+
+def _unpack_date(value):
+    if isinstance(value, int):
+        return _DATES[value]
+    return value
+
+
+def _parse_uuid(text):
+    # Só a forma canônica (minúscula, com hífens), para o texto voltar igual.
+    if not isinstance(text, str) or len(text) != 36:
+        return None
+    if text[8] != '-' or text[13] != '-' or text[18] != '-' or text[23] != '-':
+        return None
+    hexdigits = text.replace('-', '')
+    try:
+        value = bytes.fromhex(hexdigits)
+    except ValueError:
+        return None
+    return value if len(value) == 16 and value.hex() == hexdigits else None
+
+
+def _format_uuid(value):
+    h = value.hex()
+    return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+
+def _split_hash(text):
+    # 'método$sal$hexdigest' do Werkzeug -> (método, sal, digest) ou None.
+    if not isinstance(text, str):
+        return None
+    parts = text.split('$')
+    if len(parts) != 3 or not parts[1].isascii():
+        return None
+    method, salt, hexdigest = parts
+    try:
+        digest = bytes.fromhex(hexdigest)
+    except ValueError:
+        return None
+    if digest.hex() != hexdigest:
+        return None
+    return sys.intern(method), salt.encode('ascii'), digest
+
+
+class CompactUser:
+    __slots__ = ('_blob', '_salt_len', '_method', 'username', '_created')
+
+    def __init__(self, blob, salt_len, method, username, created):
+        self._blob = blob
+        self._salt_len = salt_len
+        self._method = method
+        self.username = username
+        self._created = created
+
+    @classmethod
+    def from_dict(cls, record):
+        if record.keys() != FIELDS or not isinstance(record['username'], str):
+            return None
+        id_bytes = _parse_uuid(record['id'])
+        if id_bytes is None:
+            return None
+        parsed = _split_hash(record['password_hash'])
+        if parsed is None:
+            # Hash em formato desconhecido: guarda a string inteira.
+            blob, salt_len, method = id_bytes, None, record['password_hash']
+        else:
+            method, salt, digest = parsed
+            blob, salt_len = id_bytes + salt + digest, len(salt)
+        return cls(blob, salt_len, method, record['username'], _pack_date(record['data_criacao']))
+
+    @property
+    def id(self):
+        return _format_uuid(self._blob[:16])
+
+    @property
+    def id_key(self):
+        return self._blob[:16]
+
+    @property
+    def password_hash(self):
+        if self._salt_len is None:
+            return self._method
+        salt = self._blob[16:16 + self._salt_len].decode('ascii')
+        return f'{self._method}${salt}${self._blob[16 + self._salt_len:].hex()}'
+
+    @property
+    def data_criacao(self):
+        return _unpack_date(self._created)
+
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username,
+                'password_hash': self.password_hash, 'data_criacao': self.data_criacao}
+
+    # Leitura como dict (user['username']) sem materializar o resto.
+    def __getitem__(self, field):
+        if field in FIELDS:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if isinstance(other, CompactUser):
+            return (self._blob, self._salt_len, self._method, self.username, self._created) == \
+                (other._blob, other._salt_len, other._method, other.username, other._created)
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'CompactUser({self.to_dict()!r})'
+
+
+def compact(record):
+    # Registro para guardar em memória: CompactUser quando possível.
+    if record is None or isinstance(record, CompactUser):
+        return record
+    return CompactUser.from_dict(record) or dict(record)
+
+
+def materialize(value):
+    # O inverso de compact(): sempre um dict novo (ou None).
+    if value is None:
+        return None
+    if isinstance(value, CompactUser):
+        return value.to_dict()
+    return dict(value)
+
+
+def id_key(user_id):
+    # Chave para comparar ids sem materializar o registro.
+    return _parse_uuid(user_id) or user_id
+
+
+def record_id_key(value):
+    if isinstance(value, CompactUser):
+        return value.id_key
+    return id_key(value.get('id'))
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import Response, abort, request
+from werkzeug.wsgi import wrap_file
+
+from file_lock import FileLock
+from group_commit import atomic_write_json
+
+
+# --- Downloads ---
+# Manifest dos executáveis oferecidos para download. Tamanho, SHA-256 e ETag
+# são calculados uma vez na inicialização. As respostas suportam Range e
+# If-Range (downloads retomados ou em paralelo) e usam o wsgi.file_wrapper do
+# servidor quando existe, para que ele possa usar sendfile. Atrás de um
+# proxy reverso, DOWNLOAD_OFFLOAD entrega a transferência ao nginx
+# (X-Accel-Redirect) ou ao Apache/lighttpd (X-Sendfile).
+#
+# Os contadores de downloads vão para stats_file no máximo a cada minuto.
+# Com vários processos, cada um soma ao arquivo só o que contou desde a sua
+# última gravação (sob um lock), em vez de gravar a sua cópia inteira.
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Artifact:
+    __slots__ = ('name', 'path', 'download_name', 'size', 'mtime', 'sha256', 'etag')
+
+    def __init__(self, name, path, download_name):
+        self.name = name
+        self.path = path
+        self.download_name = download_name
+        st = os.stat(path)
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        self.sha256 = h.hexdigest()
+        self.etag = self.sha256[:32]
+
+
+def _iter_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+class DownloadManager:
+    def __init__(self, root, offload=None, accel_prefix='/protected-downloads/', stats_file=None):
+        self.root = root
+        self.offload = offload
+        self.accel_prefix = accel_prefix
+        self.stats_file = stats_file
+        self.artifacts = {}
+        self._specs = {}
+        self._counts = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._last_flush = time.monotonic()
+        if stats_file:
+            self._counts = self._load_stats()
+
+    def register(self, name, relpath, download_name=None):
+        self._specs[name] = (relpath, download_name or os.path.basename(relpath))
+
+    def build(self):
+        # Com FAST_STARTUP o build roda no aquecimento; quem chegar antes
+        # (serve/manifest) espera ou faz o build.
+        with self._build_lock:
+            if self._built:
+                return
+            for name, (relpath, download_name) in self._specs.items():
+                path = os.path.join(self.root, relpath)
+                if os.path.isfile(path):
+                    self.artifacts[name] = Artifact(name, path, download_name)
+            self._built = True
+
+    def manifest(self):
+        self.build()
+        return {name: {'file': a.download_name, 'size': a.size, 'sha256': a.sha256}
+                for name, a in self.artifacts.items()}
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _add(totals, name, delta):
+        counts = totals.setdefault(name, {'full': 0, 'partial': 0, 'bytes': 0})
+        for key, value in delta.items():
+            counts[key] = counts.get(key, 0) + value
+
+    def _record(self, name, kind, nbytes):
+        delta = {kind: 1, 'bytes': nbytes}
+        with self._lock:
+            self._add(self._counts, name, delta)
+            self._add(self._pending, name, delta)
+            now = time.monotonic()
+            flush = self.stats_file and now - self._last_flush > 60
+            if flush:
+                self._last_flush = now
+                pending, self._pending = self._pending, {}
+        if flush:
+            self._flush(pending)
+
+    def _flush(self, pending):
+        with FileLock(self.stats_file + '.lock'):
+            totals = self._load_stats()
+            for name, delta in pending.items():
+                self._add(totals, name, delta)
+            atomic_write_json(self.stats_file, totals)
+        # A visão local passa a incluir o que os outros processos gravaram.
+        with self._lock:
+            for name, delta in self._pending.items():
+                self._add(totals, name, delta)
+            self._counts = totals
+
+    def stats(self):
+        with self._lock:
+            return {k: dict(v) for k, v in self._counts.items()}
+
+    def serve(self, name):
+        self.build()
+        artifact = self.artifacts.get(name)
+        if artifact is None:
+            abort(404)
+
+        if artifact.etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(artifact.etag)
+            return response
+
+        start, length, status = 0, artifact.size, 200
+        rng = request.range
+        # If-Range: só respeita o Range se o cliente ainda tem a mesma versão.
+        if_range = request.if_range
+        if rng is not None and (if_range.etag or if_range.date):
+            same_date = if_range.date is not None and int(if_range.date.timestamp()) == int(artifact.mtime)
+            if if_range.etag != artifact.etag and not same_date:
+                rng = None
+        if rng is not None and len(rng.ranges) > 1:
+            # Vários intervalos pediriam multipart/byteranges; o cliente aceita
+            # o arquivo inteiro no lugar (RFC 9110, 14.2).
+            rng = None
+        if rng is not None:
+            span = rng.range_for_length(artifact.size)
+            if span is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f'bytes */{artifact.size}'
+                return response
+            start, stop = span
+            length, status = stop - start, 206
+
+        if self.offload == 'x-accel':
+            # O proxy recebe um 200 e trata o Range por conta própria.
+            response = Response(status=200, mimetype='application/octet-stream')
+            relpath = os.path.relpath(artifact.path, self.root).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + relpath
+        elif self.offload == 'x-sendfile':
+            response = Response(status=200, mimetype='application/octet-stream')
+            response.headers['X-Sendfile'] = artifact.path
+        else:
+            f = open(artifact.path, 'rb')
+            if 'wsgi.file_wrapper' in request.environ:
+                # Waitress e gunicorn respeitam a posição atual do arquivo e o
+                # Content-Length, o que permite sendfile também para ranges.
+                f.seek(start)
+                body = wrap_file(request.environ, f, CHUNK_SIZE)
+            else:
+                body = _iter_range(f, start, length)
+            response = Response(body, status=status, mimetype='application/octet-stream',
+                                direct_passthrough=True)
+            response.content_length = length
+            if status == 206:
+                response.headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{artifact.size}'
+
+        if response.status_code == 206:
+            self._record(name, 'partial', length)
+        else:
+            self._record(name, 'full', artifact.size)
+
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Disposition'] = f'attachment; filename="{artifact.download_name}"'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.set_etag(artifact.etag)
+        response.last_modified = artifact.mtime
+        return response
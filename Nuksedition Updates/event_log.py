@@ -0,0 +1,322 @@
+import atexit
+import calendar
+import gzip
+import heapq
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+from file_lock import FileLock
+from group_commit import atomic_write
+
+
+# --- Log de eventos (auditoria) ---
+# As rotas só chamam record('login', email=...): o evento entra num buffer
+# em memória e a requisição segue, sem tocar no disco. Uma thread junta o
+# que chegou e grava em lote, uma vez a cada flush_interval (ou antes, se o
+# buffer passar de batch_size eventos).
+#
+# O buffer tem tamanho máximo (capacity). Se a escrita não acompanhar, os
+# eventos mais antigos são descartados, contados em `dropped` e registrados
+# no próprio log como {"type": "events_dropped", "count": N}.
+#
+# Cada processo grava no seu segmento, uma linha JSON por evento:
+#
+#   events-20261017T120000-1234.ndjson                       (aberto)
+#   events-20261017T120000-20261017T130000-1234.ndjson.gz    (fechado)
+#
+# O segmento aberto é fechado e comprimido quando passa de segment_bytes ou
+# de segment_seconds; o nome do segmento fechado traz o intervalo de tempo
+# dos eventos, e a consulta (query()) pula os que estão fora do período
+# pedido sem abri-los. Eventos que ainda estão no buffer (até
+# flush_interval) se perdem se o processo for morto.
+
+_SEGMENT_RE = re.compile(r'^events-(\d{8}T\d{6})(?:-(\d{8}T\d{6}))?-(\d+)\.ndjson(\.gz)?$')
+
+
+def _stamp(ts):
+    return time.strftime('%Y%m%dT%H%M%S', time.gmtime(ts))
+
+
+def _parse_stamp(text):
+    return calendar.timegm(time.strptime(text, '%Y%m%dT%H%M%S'))
+
+
+class EventLog:
+    def __init__(self, directory, flush_interval=1.0, batch_size=500, capacity=10000,
+                 segment_bytes=8 * 1024 * 1024, segment_seconds=3600):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._cond = threading.Condition()
+        self._buffer = deque(maxlen=capacity)
+        self._dropped_pending = 0
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._segment = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.write_errors = 0
+        self.segments_sealed = 0
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # Depois de um fork, o filho não tem a thread do pai: cria a sua e
+        # grava num segmento próprio.
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._segment = None
+            self._thread = threading.Thread(target=self._run, name='event-log', daemon=True)
+            self._thread.start()
+
+    def record(self, event_type, **fields):
+        event = {'ts': round(time.time(), 3), 'type': event_type}
+        event.update(fields)
+        self._ensure_started()
+        with self._cond:
+            if len(self._buffer) == self.capacity:
+                self.dropped += 1
+                self._dropped_pending += 1
+            self._buffer.append(event)
+            self.recorded += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self):
+        return len(self._buffer)
+
+    # --- Escrita (thread do log) ---
+
+    def _take(self):
+        with self._cond:
+            batch = list(self._buffer)
+            self._buffer.clear()
+            dropped, self._dropped_pending = self._dropped_pending, 0
+        if dropped:
+            batch.insert(0, {'ts': round(time.time(), 3), 'type': 'events_dropped', 'count': dropped})
+        return batch
+
+    def _run(self):
+        last_sweep = 0.0
+        while True:
+            with self._cond:
+                if len(self._buffer) < self.batch_size and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            now = time.monotonic()
+            if now - last_sweep >= self.segment_seconds / 4:
+                last_sweep = now
+                self._seal_orphans()
+            if closed:
+                try:
+                    self._seal_current()
+                except OSError as e:
+                    print(f'Log de eventos: falha ao fechar o segmento: {e!r}', file=sys.stderr)
+                return
+
+    def flush(self):
+        batch = self._take()
+        try:
+            if batch:
+                self._write(batch)
+            elif self._segment is not None and time.time() - self._segment['opened'] >= self.segment_seconds:
+                self._seal_current()
+        except OSError as e:
+            self.write_errors += 1
+            self.dropped += len(batch)
+            print(f'Log de eventos: falha ao gravar {len(batch)} eventos: {e!r}', file=sys.stderr)
+
+    def _write(self, batch):
+        data = b''.join(json.dumps(event, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+                        for event in batch)
+        segment = self._segment
+        if segment is None:
+            os.makedirs(self.directory, exist_ok=True)
+            opened = batch[0]['ts']
+            path = os.path.join(self.directory, f'events-{_stamp(opened)}-{os.getpid()}.ndjson')
+            segment = self._segment = {'path': path, 'opened': time.time(), 'size': 0}
+        fd = os.open(segment['path'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        segment['size'] += len(data)
+        self.written += len(batch)
+        self.flushes += 1
+        if segment['size'] >= self.segment_bytes or time.time() - segment['opened'] >= self.segment_seconds:
+            self._seal_current()
+
+    def _seal_current(self):
+        segment, self._segment = self._segment, None
+        if segment is not None:
+            self._seal(segment['path'])
+
+    def _seal(self, path):
+        # Comprime o segmento num .ndjson.gz com o intervalo de tempo no nome.
+        # Uma última linha sem '\n' (processo morto no meio da escrita) fica
+        # de fora.
+        with open(path, 'rb') as f:
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]
+        first = last = None
+        for line in data.splitlines():
+            try:
+                ts = float(json.loads(line)['ts'])
+            except (ValueError, KeyError, TypeError):
+                continue
+            first = ts if first is None else min(first, ts)
+            last = ts if last is None else max(last, ts)
+        match = _SEGMENT_RE.match(os.path.basename(path))
+        if first is not None and match is not None:
+            # Dois segmentos do mesmo processo no mesmo segundo: estica o fim
+            # do intervalo em vez de sobrescrever o anterior.
+            last += 1
+            while True:
+                name = f'events-{_stamp(first)}-{_stamp(last)}-{match.group(3)}.ndjson.gz'
+                target = os.path.join(os.path.dirname(path), name)
+                if not os.path.exists(target):
+                    break
+                last += 1
+            atomic_write(target, lambda f: f.write(gzip.compress(data)), mode='wb')
+            self.segments_sealed += 1
+        os.unlink(path)
+
+    def _seal_orphans(self):
+        # Segmentos abertos de processos que morreram (ou reiniciaram). Um
+        # processo vivo fecha o seu antes de segment_seconds, então um .ndjson
+        # parado há mais que o dobro disso não tem mais dono.
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        own = self._segment['path'] if self._segment is not None else None
+        limit = time.time() - 2 * self.segment_seconds
+        try:
+            with FileLock(os.path.join(self.directory, '.seal.lock')):
+                for name in names:
+                    match = _SEGMENT_RE.match(name)
+                    path = os.path.join(self.directory, name)
+                    if match is None or match.group(4) or path == own:
+                        continue
+                    try:
+                        if os.path.getmtime(path) < limit:
+                            self._seal(path)
+                    except FileNotFoundError:
+                        continue
+        except OSError as e:
+            print(f'Log de eventos: falha ao fechar segmentos antigos: {e!r}', file=sys.stderr)
+
+    def close(self):
+        # Grava o que restou no buffer (chamado também no atexit).
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout=5)
+        else:
+            self.flush()
+
+    def stats(self):
+        return {'recorded': self.recorded, 'written': self.written, 'dropped': self.dropped,
+                'pending': len(self._buffer), 'flushes': self.flushes, 'write_errors': self.write_errors,
+                'segments_sealed': self.segments_sealed}
+
+
+# --- Consulta ---
+# Lê os segmentos em streaming (linha a linha, gzip incluso), pulando pelo
+# nome os que não cruzam [since, until). Segmentos de processos diferentes
+# que se sobrepõem no tempo são intercalados por ts; os demais são lidos um
+# de cada vez, em ordem.
+
+def segments(directory, since=None, until=None):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    found = []
+    for name in names:
+        match = _SEGMENT_RE.match(name)
+        if match is None:
+            continue
+        path = os.path.join(directory, name)
+        start = _parse_stamp(match.group(1))
+        if match.group(2):
+            end = _parse_stamp(match.group(2))
+        else:
+            # Segmento aberto: vai até a última escrita.
+            try:
+                end = os.path.getmtime(path) + 1
+            except FileNotFoundError:
+                continue
+        if (until is not None and start >= until) or (since is not None and end < since):
+            continue
+        found.append((start, end, path))
+    found.sort()
+    return found
+
+
+def _read_segment(path, since, until, needles):
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                if needles is not None and not any(needle in line for needle in needles):
+                    continue
+                try:
+                    event = json.loads(line)
+                    ts = float(event['ts'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if (since is not None and ts < since) or (until is not None and ts >= until):
+                    continue
+                yield ts, line, event
+    except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+        # Segmento fechado enquanto era lido, ou .gz truncado.
+        return
+
+
+def query(directory, since=None, until=None, types=None, match=None):
+    # Gera (ts, linha, evento) em ordem de ts. match: campos que o evento
+    # precisa ter com exatamente esses valores (por exemplo {'email': ...}).
+    needles = None
+    if types:
+        needles = [json.dumps({'type': t}, ensure_ascii=False, separators=(',', ':'))[1:-1].encode('utf-8')
+                   for t in types]
+    types = set(types) if types else None
+    groups = []
+    group_end = None
+    for start, end, path in segments(directory, since, until):
+        if groups and start < group_end:
+            groups[-1].append(path)
+            group_end = max(group_end, end)
+        else:
+            groups.append([path])
+            group_end = end
+    for group in groups:
+        readers = [_read_segment(path, since, until, needles) for path in group]
+        for ts, line, event in heapq.merge(*readers, key=lambda item: item[0]):
+            if types is not None and event.get('type') not in types:
+                continue
+            if match and any(event.get(k) != v for k, v in match.items()):
+                continue
+            yield ts, line, event
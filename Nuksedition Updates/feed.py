@@ -0,0 +1,264 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from file_lock import FileLock
+
+
+# --- Feed (Explorar, Jogos, Notícias) ---
+# Catálogo de conteúdo num arquivo NDJSON só de acréscimo: cada publicação
+# é uma linha no fim do arquivo e nada é regravado. Retirar um item também
+# é uma linha nova ({"id": 7, "retracted": true}).
+#
+#   {"id":1,"kind":"download","title":"...","body":"...","url":"...","image":"...","published":1760000000}
+#
+# Os ids são crescentes, então a lista de ids de cada tipo já está ordenada.
+# A página "mais recentes antes do cursor" sai de um bisect nessa lista, sem
+# percorrer os itens anteriores como faria um OFFSET. O cursor é o id do
+# último item entregue.
+#
+# Cada linha do arquivo é guardada como veio e vira o JSON do item na
+# resposta, sem serializar de novo. As páginas montadas ficam num LRU que é
+# esvaziado a cada publicação, inclusive as feitas por outros processos
+# (vistas pelo crescimento do arquivo, no máximo a cada check_interval).
+
+KINDS = ('game', 'download', 'news')
+MAX_LIMIT = 50
+
+FeedItem = namedtuple('FeedItem', 'id kind title body url image published')
+
+
+def _add_fields(line, fields):
+    # Acrescenta campos ao objeto JSON da linha sem decodificá-lo.
+    if not fields:
+        return line
+    return line[:-1] + b',' + json.dumps(fields, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[1:]
+
+
+def _decode_cursor(cursor):
+    try:
+        value = int(cursor)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+class FeedPage:
+    __slots__ = ('ids', 'lines', 'next_cursor', 'etag')
+
+    def __init__(self, ids, lines, next_cursor):
+        self.ids = ids
+        self.lines = lines
+        self.next_cursor = next_cursor
+        h = hashlib.sha256()
+        for line in lines:
+            h.update(line)
+            h.update(b'\n')
+        h.update(str(next_cursor).encode())
+        self.etag = h.hexdigest()[:32]
+
+    def with_fields(self, fields):
+        # Cópia da página com campos extras por id (por exemplo URLs que
+        # dependem do app); o ETag passa a cobri-los também.
+        if not fields:
+            return self
+        lines = [_add_fields(line, fields.get(i)) for i, line in zip(self.ids, self.lines)]
+        return FeedPage(self.ids, lines, self.next_cursor)
+
+    def json_body(self):
+        cursor = 'null' if self.next_cursor is None else f'"{self.next_cursor}"'
+        return (b'{"success":true,"items":[' + b','.join(self.lines) +
+                b'],"next_cursor":' + cursor.encode() + b'}')
+
+    def ndjson_chunks(self):
+        for line in self.lines:
+            yield line + b'\n'
+
+
+class Feed:
+    def __init__(self, path, check_interval=1.0, cache_size=256):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache_size = cache_size
+        self._file_lock = FileLock(path + '.lock')
+        self._lock = threading.RLock()
+        self._pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._reset()
+
+    def _reset(self):
+        self._items = {}
+        self._lines = {}
+        # None -> todos os tipos; ids sempre em ordem crescente.
+        self._ids = {None: []}
+        for kind in KINDS:
+            self._ids[kind] = []
+        self._last_id = 0
+        self._offset = 0
+        self._stamp = None
+        self._checked_at = 0.0
+        self._pages.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    # --- Leitura do arquivo ---
+
+    def _apply(self, line):
+        try:
+            entry = json.loads(line)
+            item_id = int(entry['id'])
+        except (ValueError, KeyError, TypeError):
+            return
+        self._last_id = max(self._last_id, item_id)
+        if entry.get('retracted'):
+            item = self._items.pop(item_id, None)
+            if item is not None:
+                del self._lines[item_id]
+                for kind in (None, item.kind):
+                    ids = self._ids[kind]
+                    del ids[bisect.bisect_left(ids, item_id)]
+            return
+        kind = entry.get('kind')
+        if kind not in KINDS or item_id in self._items:
+            return
+        self._items[item_id] = FeedItem(item_id, kind, entry.get('title', ''), entry.get('body', ''),
+                                        entry.get('url'), entry.get('image'), entry.get('published'))
+        self._lines[item_id] = line
+        for ids in (self._ids[None], self._ids[kind]):
+            if not ids or ids[-1] < item_id:
+                ids.append(item_id)
+            else:
+                bisect.insort(ids, item_id)
+
+    def _read_tail(self):
+        # Lê só o que foi acrescentado desde a última leitura. Se o arquivo
+        # foi trocado ou encolheu (compactação manual), recarrega do zero.
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._stamp is not None:
+                self._reset()
+            return
+        stamp = (st.st_ino, st.st_size)
+        if stamp == self._stamp:
+            return
+        if self._stamp is not None and (st.st_ino != self._stamp[0] or st.st_size < self._offset):
+            self._reset()
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # Uma linha sem '\n' ainda está sendo escrita; fica para a próxima.
+        end = data.rfind(b'\n') + 1
+        changed = False
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if line:
+                self._apply(line)
+                changed = True
+        self._offset += end
+        self._stamp = (st.st_ino, self._offset) if end < len(data) else stamp
+        if changed:
+            self.generation += 1
+            self._pages.clear()
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if force or now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                self._read_tail()
+
+    # --- Escrita ---
+
+    def _append(self, entries):
+        with self._lock, self._file_lock:
+            return self._append_locked(entries)
+
+    def _append_locked(self, entries):
+        # Com o lock de arquivo: lê o que outros processos publicaram, numera
+        # a partir do maior id e grava tudo com um único write.
+        self._read_tail()
+        lines = []
+        for entry in entries:
+            if 'id' not in entry:
+                entry = {'id': self._last_id + len(lines) + 1, **entry}
+            lines.append(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, b''.join(line + b'\n' for line in lines))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._read_tail()
+        self._checked_at = time.monotonic()
+        return [json.loads(line)['id'] for line in lines]
+
+    def publish(self, kind, title, body='', url=None, image=None, published=None):
+        if kind not in KINDS:
+            raise ValueError(f'tipo desconhecido: {kind}')
+        entry = {'kind': kind, 'title': title, 'body': body, 'url': url, 'image': image,
+                 'published': int(published if published is not None else time.time())}
+        return self._append([entry])[0]
+
+    def retract(self, item_id):
+        with self._lock:
+            self.refresh(force=True)
+            if item_id not in self._items:
+                return False
+        self._append([{'id': item_id, 'retracted': True}])
+        return True
+
+    def seed(self, entries):
+        # Conteúdo inicial, gravado só se o catálogo ainda não existe.
+        now = int(time.time())
+        with self._lock, self._file_lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                return False
+            self._append_locked([{'kind': e['kind'], 'title': e['title'], 'body': e.get('body', ''),
+                                  'url': e.get('url'), 'image': e.get('image'), 'published': now}
+                                 for e in entries])
+            return True
+
+    # --- Páginas ---
+
+    def page(self, kind=None, cursor=None, limit=20):
+        if kind not in self._ids:
+            raise ValueError(f'tipo desconhecido: {kind}')
+        limit = min(max(limit, 1), MAX_LIMIT)
+        before = _decode_cursor(cursor)
+        self.refresh()
+        key = (kind, before, limit)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return page
+            self.misses += 1
+            ids = self._ids[kind]
+            end = bisect.bisect_left(ids, before) if before else len(ids)
+            start = max(0, end - limit)
+            selected = ids[start:end][::-1]
+            page = FeedPage(selected, [self._lines[i] for i in selected], ids[start] if start > 0 else None)
+            self._pages[key] = page
+            while len(self._pages) > self.cache_size:
+                self._pages.popitem(last=False)
+            return page
+
+    def items(self, page):
+        # Itens da página para os templates (namedtuples, hashable: a página
+        # renderizada também entra no cache do RenderCache).
+        with self._lock:
+            return tuple(self._items[i] for i in page.ids if i in self._items)
+
+    def stats(self):
+        with self._lock:
+            return {'items': len(self._items), 'pages_cached': len(self._pages),
+                    'cache_hits': self.hits, 'cache_misses': self.misses, 'generation': self.generation}
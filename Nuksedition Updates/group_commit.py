@@ -0,0 +1,125 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import Future
+
+
+# --- Escrita atômica ---
+# Grava num arquivo temporário no mesmo diretório, faz fsync e troca com
+# os.replace; um crash no meio da escrita deixa o arquivo antigo intacto.
+
+def atomic_write(path, write, mode='w'):
+    # write(f) recebe o arquivo temporário já aberto.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def atomic_write_json(path, data):
+    atomic_write(path, lambda f: json.dump(data, f, indent=4))
+
+
+# --- Group commit ---
+# Todas as alterações passam por uma única thread escritora. Ela junta as
+# alterações que chegaram ao mesmo tempo, aplica todas em ordem sobre a
+# mesma cópia dos dados e faz uma única escrita para o lote inteiro. Quem
+# chamou submit() só volta depois que o lote foi gravado em disco. finish(),
+# se informado, roda ao fim de cada lote (mesmo com erro), por exemplo para
+# soltar um lock pego em begin().
+
+class GroupCommitWriter:
+    def __init__(self, begin, commit, max_batch=256, finish=None):
+        self._begin = begin
+        self._commit = commit
+        self._finish = finish
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.mutations = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            finally:
+                if self._finish is not None:
+                    self._finish()
+
+    def _apply(self, batch):
+        try:
+            data = self._begin()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        results = []
+        changed = False
+        for fn, future in batch:
+            try:
+                result = fn(data)
+            except Exception as e:
+                results.append((future, e, None))
+                continue
+            changed = changed or bool(result)
+            results.append((future, None, result))
+
+        if changed:
+            try:
+                self._commit(data)
+            except Exception as e:
+                for future, _, _ in results:
+                    future.set_exception(e)
+                return
+
+        self.batches += 1
+        self.mutations += len(batch)
+        for future, error, result in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {'commit_batches': self.batches, 'commit_mutations': self.mutations}
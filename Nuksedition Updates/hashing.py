@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+# --- Serviço de hash de senhas ---
+# O pbkdf2 é caro de propósito. Em vez de rodar na thread da requisição, o
+# cálculo vai para um pool de processos (escala com os núcleos e não segura
+# o GIL). Se houver pedidos demais na fila, ou se um cálculo passar de
+# `timeout`, HasherBusy é levantado e a rota responde 503 em vez de acumular
+# trabalho.
+#
+# workers=None divide os núcleos entre os processos do servidor: com o
+# launcher em modo pré-fork (WEB_WORKERS=N), cada processo fica com
+# cpu_count // N workers de hash, e não cpu_count cada um.
+
+class HasherBusy(Exception):
+    pass
+
+
+def normalize_method(method):
+    # 'pbkdf2:sha256' sem iterações usa o padrão do Werkzeug.
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2' and len(parts) == 2:
+        parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    return ':'.join(parts)
+
+
+def _watch_parent(parent):
+    # Roda em cada worker do pool: se o processo que criou o pool morrer sem
+    # desligá-lo (SIGTERM do launcher, SIGKILL), o worker sai também em vez
+    # de ficar órfão esperando trabalho.
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, name='pool-parent-watch', daemon=True).start()
+
+
+def default_workers():
+    processes = max(1, int(os.getenv('WEB_WORKERS') or 1))
+    return max(1, (os.cpu_count() or 1) // processes)
+
+
+class PasswordHasher:
+    def __init__(self, method='pbkdf2:sha256', workers=None, max_pending=64, timeout=30.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers or default_workers(),
+                                                     initializer=_watch_parent, initargs=(os.getpid(),))
+        return self._pool
+
+    def _replace_pool(self, broken):
+        # Só o primeiro que notar troca o pool; o antigo é desligado.
+        with self._pool_lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args):
+        pool = self._get_pool()
+        future = pool.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.timeouts += 1
+            raise HasherBusy()
+
+    def warm(self):
+        # Sobe um worker do pool antes do primeiro login ou cadastro.
+        if self.workers != 0:
+            self._get_pool().submit(normalize_method, self.method).result()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            if self.workers == 0:
+                return fn(*args)
+            pool = self._get_pool()
+            try:
+                return self._submit(fn, *args)
+            except BrokenProcessPool:
+                # Um worker morreu; recria o pool e tenta mais uma vez.
+                self._replace_pool(pool)
+                return self._submit(fn, *args)
+        finally:
+            self._slots.release()
+
+    async def _run_async(self, fn, *args):
+        # Versão para o modo ASGI: a corrotina espera o resultado do pool sem
+        # ocupar uma thread. asyncio só é importado quando este modo é usado.
+        import asyncio
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            if self.workers == 0:
+                return await asyncio.to_thread(fn, *args)
+            future = asyncio.wrap_future(self._get_pool().submit(fn, *args))
+            try:
+                return await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise HasherBusy()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    async def hash_async(self, password):
+        return await self._run_async(generate_password_hash, password, self.method)
+
+    async def verify_async(self, password_hash, password):
+        return await self._run_async(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
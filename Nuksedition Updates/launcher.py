@@ -0,0 +1,124 @@
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+import startup
+
+
+# --- Launcher pre-fork ---
+# Abre o socket uma vez e cria N processos filhos, cada um com seu próprio
+# Waitress (e seu próprio GIL) aceitando conexões no mesmo socket. O pai só
+# supervisiona: recria filhos que morrem e repassa SIGINT/SIGTERM. Sem fork
+# (Windows) ou com --workers 1 roda um Waitress comum; --dev usa o servidor
+# de desenvolvimento do Flask como antes.
+#
+#   python app.py --workers 4 --port 8000
+#   python app.py --startup-report
+#
+# Com mais de um processo, códigos e limites de taxa precisam de
+# SHARED_BACKEND_URL e as sessões não podem ficar em memória.
+
+
+def check_shared_state(config, workers):
+    problems = []
+    if workers > 1 and not config.get('SHARED_BACKEND_URL'):
+        problems.append('defina SHARED_BACKEND_URL (sqlite:///... ou redis://...)')
+    if workers > 1 and config.get('SESSION_BACKEND') == 'memory':
+        problems.append('SESSION_BACKEND=memory não é compartilhado entre processos')
+    return problems
+
+
+def serve_forked(app, sock, workers, threads):
+    from waitress import serve
+
+    children = {}
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                # Cada filho aquece o que ficou adiado (FAST_STARTUP).
+                startup.prewarm()
+                serve(app, sockets=[sock], threads=threads, ident='NuksEdition')
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (slot, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+    print(f'{workers} processos atendendo em {sock.getsockname()}', file=sys.stderr)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot, started = children.pop(pid, (None, None))
+        if stopping or slot is None:
+            continue
+        print(f'Processo {pid} terminou (status {status}); criando outro', file=sys.stderr)
+        # Evita um laço apertado se o filho morre logo ao subir.
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+        spawn(slot)
+
+
+def main(app, argv=None):
+    parser = argparse.ArgumentParser(description='Servidor do NuksEdition')
+    parser.add_argument('--host', default=os.getenv('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_WORKERS', 1)))
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WEB_THREADS', 8)))
+    parser.add_argument('--dev', action='store_true', help='servidor de desenvolvimento do Flask (debug)')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='mede imports e etapas da inicialização num processo novo e sai')
+    args = parser.parse_args(argv)
+
+    if args.startup_report:
+        sys.exit(startup.report(app.root_path))
+
+    if args.dev:
+        startup.prewarm()
+        app.run(host=args.host, port=args.port, debug=True)
+        return
+
+    workers = args.workers if hasattr(os, 'fork') else 1
+    # Lido pelo PasswordHasher ao criar o pool (depois do fork): os núcleos
+    # são divididos entre os processos.
+    os.environ['WEB_WORKERS'] = str(workers)
+    problems = check_shared_state(app.config, workers)
+    if problems:
+        sys.exit('Não é possível usar vários processos: ' + '; '.join(problems))
+
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    if workers <= 1:
+        from waitress import serve
+        # O socket já aceita conexões (ficam no backlog) enquanto aquece.
+        startup.prewarm()
+        serve(app, sockets=[sock], threads=args.threads, ident='NuksEdition')
+        return
+
+    serve_forked(app, sock, workers, args.threads)
@@ -0,0 +1,197 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import span
+
+
+# --- Fila de envio de e-mails ---
+# As rotas só colocam a mensagem na fila e recebem um ticket. Um pool de
+# threads entrega as mensagens em segundo plano, reaproveitando a conexão
+# SMTP entre envios, com novas tentativas e espera exponencial em caso de
+# falha. O status de cada ticket pode ser consultado depois.
+
+QUEUED = 'queued'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+# --- Transportes ---
+# Cada transporte abre uma "sessão" por worker; a sessão tem send() e close().
+
+class SMTPTransport:
+    def __init__(self, mail, max_emails=100):
+        self.mail = mail
+        self.max_emails = max_emails
+
+    def open(self):
+        return _SMTPSession(self.mail, self.max_emails)
+
+
+class _SMTPSession:
+    def __init__(self, mail, max_emails):
+        self._conn = mail.connect()
+        self._conn.__enter__()
+        self.max_emails = max_emails
+        self.sent = 0
+
+    def send(self, msg):
+        self._conn.send(msg)
+        self.sent += 1
+
+    @property
+    def exhausted(self):
+        return self.sent >= self.max_emails
+
+    def close(self):
+        try:
+            self._conn.__exit__(None, None, None)
+        except Exception:
+            pass
+
+
+class FileTransport:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return self
+
+    def send(self, msg):
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex}.eml'
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(msg.as_string())
+
+    exhausted = False
+
+    def close(self):
+        pass
+
+
+class NullTransport:
+    def __init__(self):
+        self.outbox = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        return self
+
+    def send(self, msg):
+        with self._lock:
+            self.outbox.append(msg)
+
+    exhausted = False
+
+    def close(self):
+        pass
+
+
+def create_transport(config, mail):
+    kind = config.get('MAIL_TRANSPORT', 'smtp')
+    if kind == 'smtp':
+        return SMTPTransport(mail, max_emails=config.get('MAIL_MAX_EMAILS') or 100)
+    if kind == 'file':
+        return FileTransport(config.get('MAIL_FILE_DIR', 'mail_outbox'))
+    if kind == 'null':
+        return NullTransport()
+    raise ValueError(f'Transporte de e-mail desconhecido: {kind}')
+
+
+class MailQueue:
+    def __init__(self, app, transport, workers=2, max_retries=3, backoff=1.0,
+                 idle_timeout=30.0, max_tickets=10000):
+        self.app = app
+        self.transport = transport
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.max_tickets = max_tickets
+        self._queue = queue.Queue()
+        self._tickets = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'mail-worker-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def set_status(self, ticket, **fields):
+        with self._lock:
+            info = self._tickets.get(ticket)
+            if info is not None:
+                info.update(fields)
+
+    def track(self):
+        # Cria um ticket sem colocar mensagem na fila; usado por quem entrega
+        # o e-mail por conta própria (async_mail.py).
+        ticket = uuid.uuid4().hex
+        with self._lock:
+            self._tickets[ticket] = {'status': QUEUED, 'attempts': 0, 'error': None}
+            while len(self._tickets) > self.max_tickets:
+                self._tickets.popitem(last=False)
+        return ticket
+
+    def enqueue(self, msg):
+        self._ensure_started()
+        ticket = self.track()
+        self._queue.put((ticket, msg))
+        return ticket
+
+    def status(self, ticket):
+        with self._lock:
+            info = self._tickets.get(ticket)
+            return dict(info) if info is not None else None
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _worker(self):
+        session = None
+        while True:
+            try:
+                ticket, msg = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Fecha a conexão ociosa; uma nova é aberta no próximo envio.
+                if session is not None:
+                    session.close()
+                    session = None
+                continue
+
+            with self.app.app_context():
+                for attempt in range(1, self.max_retries + 1):
+                    self.set_status(ticket, status=SENDING, attempts=attempt)
+                    try:
+                        if session is None:
+                            session = self.transport.open()
+                        with span('mail_send'):
+                            session.send(msg)
+                    except Exception as e:
+                        if session is not None:
+                            session.close()
+                            session = None
+                        self.app.logger.warning('Falha ao enviar e-mail (tentativa %d): %s', attempt, e)
+                        if attempt == self.max_retries:
+                            self.set_status(ticket, status=FAILED, error=str(e))
+                        else:
+                            time.sleep(self.backoff * 2 ** (attempt - 1))
+                        continue
+                    self.set_status(ticket, status=SENT)
+                    break
+
+            if session is not None and session.exhausted:
+                session.close()
+                session = None
+            self._queue.task_done()
@@ -0,0 +1,207 @@
+import cProfile
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+from flask.signals import before_render_template, template_rendered
+
+
+# --- Métricas ---
+# Histogramas em memória no formato do Prometheus. O app mede o tempo de cada
+# rota (before_request/after_request) e trechos internos: leitura e gravação
+# do store, hash de senha, envio de e-mail e renderização de template. Tudo
+# é exposto em texto em /metrics.
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# O método vem do cliente; qualquer outro verbo vira 'other' para que não
+# dê para criar séries sem limite.
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+LOOPBACK = frozenset(('127.0.0.1', '::1'))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for labelvalues, counts, total, count in sorted(items):
+            cumulative = 0
+            inf = 'le="+Inf"'
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labelvalues, inf)} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labelvalues)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        h = Histogram(name, help, labelnames, buckets)
+        self._histograms.append(h)
+        return h
+
+    def collector(self, fn):
+        # fn() devolve uma lista de (nome, tipo, {labels}, valor).
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for h in self._histograms:
+            lines.extend(h.render())
+        for fn in self._collectors:
+            try:
+                samples = fn()
+            except Exception:
+                continue
+            seen = set()
+            for name, kind, labels, value in samples:
+                if name not in seen:
+                    lines.append(f'# TYPE {name} {kind}')
+                    seen.add(name)
+                lines.append(f'{name}{_labels(labels.keys(), labels.values())} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram(
+    'nuks_request_seconds', 'Duração das requisições por rota', ('endpoint', 'method', 'status'))
+SPAN_SECONDS = REGISTRY.histogram(
+    'nuks_span_seconds', 'Duração de trechos internos (store, hash, e-mail, template)', ('span',))
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class TimedProxy:
+    # Mede as chamadas aos métodos listados e repassa o resto sem alteração.
+    def __init__(self, target, prefix, methods):
+        self._target = target
+        self._prefix = prefix
+        self._methods = frozenset(methods)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._methods:
+            return attr
+        span_name = f'{self._prefix}_{name}'
+
+        def timed(*args, **kwargs):
+            with span(span_name):
+                return attr(*args, **kwargs)
+        return timed
+
+
+# --- Integração com o Flask ---
+
+_render_stack = threading.local()
+_profile_seq = itertools.count(1)
+
+
+def _before_render(sender, template, context, **extra):
+    stack = getattr(_render_stack, 'items', None)
+    if stack is None:
+        stack = _render_stack.items = []
+    stack.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stack = getattr(_render_stack, 'items', None)
+    if stack:
+        SPAN_SECONDS.observe(time.perf_counter() - stack.pop(), 'render_template')
+
+
+def init_app(app, registry=REGISTRY):
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        # Profiler opcional por requisição: PROFILING_ENABLED e o cabeçalho
+        # X-Profile com o valor de PROFILING_TOKEN.
+        token = app.config.get('PROFILING_TOKEN')
+        if app.config.get('PROFILING_ENABLED') and token and request.headers.get('X-Profile') == token:
+            g._profiler = cProfile.Profile()
+            g._profiler.enable()
+
+    @app.after_request
+    def _stop_timer(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            directory = app.config.get('PROFILING_DIR', 'profiles')
+            os.makedirs(directory, exist_ok=True)
+            # pid + sequência: duas requisições no mesmo segundo (no mesmo
+            # processo ou não) não sobrescrevem o arquivo uma da outra.
+            name = f'{time.strftime("%Y%m%d-%H%M%S")}-{request.endpoint}-{os.getpid()}-{next(_profile_seq)}.prof'
+            path = os.path.join(directory, name)
+            profiler.dump_stats(path)
+            response.headers['X-Profile-File'] = os.path.basename(path)
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            method = request.method if request.method in KNOWN_METHODS else 'other'
+            REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    request.endpoint or 'not_found', method, response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        # Com METRICS_TOKEN exige o token; sem ele, só atende conexões locais
+        # que não passaram por um proxy (X-Forwarded-For).
+        token = app.config.get('METRICS_TOKEN')
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                return Response('Unauthorized', status=401)
+        elif request.remote_addr not in LOOPBACK or 'X-Forwarded-For' in request.headers:
+            return Response('Forbidden', status=403)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, make_response, render_template, request
+from jinja2 import meta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# --- Cache de renderização ---
+# Os templates de Public/ e protect/ são compilados na inicialização. Para
+# cada template descobrimos quais variáveis ele realmente usa; a saída
+# renderizada é guardada por (template, valores dessas variáveis), junto com
+# um ETag forte e as versões gzip/brotli já comprimidas. Assim home.html e
+# explorar.html, que recebem `usuario` mas não o usam, têm um único corpo
+# em cache para todos os usuários.
+#
+# Cada codificação é uma representação diferente e tem o seu ETag forte
+# (<hash>, <hash>-gz, <hash>-br), com Vary: Accept-Encoding. Páginas com
+# valores que mudam a cada requisição (o ticket do confirmar.html) usam
+# cache=False e não ocupam o LRU.
+#
+# ready (opcional) diz se a saída já pode ir para o cache. Com FAST_STARTUP,
+# uma página renderizada antes das variantes de imagem existirem aponta para
+# os PNGs originais; até o aquecimento terminar as páginas saem sem cache.
+
+# Globais que dependem da requisição: templates que usam isto não são
+# cacheados. Os demais globais do Jinja (url_for, image_url...) não mudam a
+# saída entre requisições.
+DYNAMIC_GLOBALS = {'request', 'session', 'g'}
+
+
+class CachedPage:
+    __slots__ = ('body', 'etag', 'gzip', 'br')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.gzip = gzip.compress(body, 9)
+        self.br = brotli.compress(body) if brotli is not None else None
+
+
+class RenderCache:
+    def __init__(self, app, folders=('Public', 'protect'), maxsize=2048, ready=None):
+        self.app = app
+        self.folders = folders
+        self.maxsize = maxsize
+        self.ready = ready
+        self._variables = {}
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def precompile(self):
+        env = self.app.jinja_env
+        for folder in self.folders:
+            directory = os.path.join(self.app.root_path, folder)
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.html'):
+                    self._inspect(env, f'{folder}/{name}')
+
+    def _inspect(self, env, template):
+        # get_template compila e guarda no cache do próprio Jinja.
+        env.get_template(template)
+        source = env.loader.get_source(env, template)[0]
+        names = meta.find_undeclared_variables(env.parse(source))
+        if names & DYNAMIC_GLOBALS:
+            self._variables[template] = None
+        else:
+            self._variables[template] = tuple(sorted(n for n in names if n not in env.globals))
+        return self._variables[template]
+
+    def _key(self, template, context):
+        if template not in self._variables:
+            self._inspect(self.app.jinja_env, template)
+        names = self._variables[template]
+        if names is None:
+            return None
+        values = tuple(context.get(n) for n in names)
+        try:
+            hash(values)
+        except TypeError:
+            return None
+        return (template, values)
+
+    def _get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return page
+
+    def _put(self, key, page):
+        with self._lock:
+            self._pages[key] = page
+            while len(self._pages) > self.maxsize:
+                self._pages.popitem(last=False)
+
+    def render(self, template, private=False, cache=True, **context):
+        if cache and self.ready is not None and not self.ready():
+            cache = False
+        key = self._key(template, context) if cache else None
+        if key is None:
+            response = make_response(render_template(template, **context))
+            if private:
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+        page = self._get(key)
+        if page is None:
+            page = CachedPage(render_template(template, **context).encode('utf-8'))
+            self._put(key, page)
+
+        cache_control = 'private, no-cache' if private else 'no-cache'
+        encodings = request.accept_encodings
+        if page.br is not None and encodings['br']:
+            body, coding, etag = page.br, 'br', page.etag + '-br'
+        elif encodings['gzip']:
+            body, coding, etag = page.gzip, 'gzip', page.etag + '-gz'
+        else:
+            body, coding, etag = page.body, None, page.etag
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='text/html')
+            if coding is not None:
+                response.headers['Content-Encoding'] = coding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._pages)}
@@ -0,0 +1,387 @@
+import bisect
+import gc
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from user_store import UserStore
+
+
+# --- Busca de usuários ---
+# Índice em memória sobre os nomes de usuário, montado uma vez a partir do
+# store e atualizado a cada cadastro, troca de nome ou exclusão.
+#
+# Prefixo (typeahead): lista ordenada de (termo, doc). Os termos são o nome
+# completo normalizado e cada palavra dele; todas as chaves que começam com
+# o prefixo ficam num intervalo contíguo, achado com bisect em O(log n).
+# Funciona como um trie compacto, sem um dict por nó.
+#
+# Erros de digitação: índice de trigramas sobre o vocabulário (as palavras
+# distintas dos nomes), bem menor que a base de usuários. Cada palavra da
+# busca é comparada às palavras do vocabulário pelo coeficiente de Dice dos
+# trigramas; um nome entra no resultado se todas as palavras da busca têm
+# uma parecida nele.
+#
+# Ordem: nome igual, nome começando com a busca, palavra começando com a
+# busca, aproximados por nota. Os resultados trazem id e nome, nunca e-mail.
+
+MAX_RESULTS = 200
+MIN_FUZZY_SCORE = 0.45
+MAX_FUZZY_WORDS = 50
+MAX_FUZZY_CANDIDATES = 500
+
+
+def normalize(text):
+    text = text.casefold()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return ' '.join(text.split())
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class UserSearchIndex:
+    def __init__(self, max_posting=5000):
+        self.max_posting = max_posting
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        # doc -> (id, username, nome normalizado); docs removidos viram None.
+        self._docs = []
+        self._doc_by_id = {}
+        self._keys = []
+        # palavra -> [trigramas, nº de nomes que usam a palavra]
+        self._words = {}
+        self._word_grams = {}
+        # Vocabulário ordenado, para completar a última palavra da busca.
+        self._vocab = []
+
+    def __len__(self):
+        return len(self._doc_by_id)
+
+    @staticmethod
+    def _terms(name):
+        terms = {name}
+        terms.update(name.split())
+        return terms
+
+    def build(self, items):
+        # items: (user_id, username); reconstrói o índice inteiro. O coletor
+        # de lixo fica pausado: criar centenas de milhares de tuplas dispara
+        # coletas completas que triplicam o tempo da montagem.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with self._lock:
+                self._reset()
+                keys = []
+                for user_id, username in items:
+                    keys.extend(self._add_doc(user_id, username))
+                keys.sort()
+                self._keys = keys
+                self._vocab = sorted(self._words)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _add_doc(self, user_id, username, incremental=False):
+        name = normalize(username)
+        doc = len(self._docs)
+        self._docs.append((user_id, username, name))
+        self._doc_by_id[user_id] = doc
+        for word in set(name.split()):
+            entry = self._words.get(word)
+            if entry is None:
+                grams = frozenset(trigrams(word))
+                self._words[word] = [grams, 1]
+                for gram in grams:
+                    self._word_grams.setdefault(gram, set()).add(word)
+                if incremental:
+                    bisect.insort(self._vocab, word)
+            else:
+                entry[1] += 1
+        return [(term, doc) for term in self._terms(name)]
+
+    def add(self, user_id, username):
+        with self._lock:
+            if user_id in self._doc_by_id:
+                self.remove(user_id)
+            for key in self._add_doc(user_id, username, incremental=True):
+                bisect.insort(self._keys, key)
+
+    def remove(self, user_id):
+        with self._lock:
+            doc = self._doc_by_id.pop(user_id, None)
+            if doc is None:
+                return
+            _, _, name = self._docs[doc]
+            self._docs[doc] = None
+            for key in self._terms(name):
+                i = bisect.bisect_left(self._keys, (key, doc))
+                if i < len(self._keys) and self._keys[i] == (key, doc):
+                    del self._keys[i]
+            for word in set(name.split()):
+                entry = self._words[word]
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._words[word]
+                    del self._vocab[bisect.bisect_left(self._vocab, word)]
+                    for gram in trigrams(word):
+                        posting = self._word_grams[gram]
+                        posting.discard(word)
+                        if not posting:
+                            del self._word_grams[gram]
+
+    def _range(self, low, high):
+        start = bisect.bisect_left(self._keys, (low,))
+        end = bisect.bisect_left(self._keys, (high,), lo=start)
+        return start, end
+
+    def _prefix_docs(self, prefix, limit):
+        # Intervalo [prefix, prefix + U+10FFFF) da lista ordenada.
+        start, end = self._range(prefix, prefix + '\U0010ffff')
+        seen = []
+        found = set()
+        for i in range(start, end):
+            doc = self._keys[i][1]
+            if doc not in found:
+                found.add(doc)
+                seen.append(doc)
+                if len(seen) >= limit:
+                    break
+        return seen
+
+    def _similar_words(self, token, prefix=False):
+        # Candidatas saem dos trigramas menos comuns; a nota é calculada com
+        # todos os trigramas. Com prefix=True, palavras que começam com o
+        # token também valem nota 1.
+        scored = {}
+        if prefix:
+            start = bisect.bisect_left(self._vocab, token)
+            for word in self._vocab[start:start + MAX_FUZZY_WORDS]:
+                if not word.startswith(token):
+                    break
+                scored[word] = 1.0
+        grams = trigrams(token)
+        counts = Counter()
+        for gram in grams:
+            posting = self._word_grams.get(gram)
+            if posting and len(posting) <= self.max_posting:
+                counts.update(posting)
+        for word, _ in counts.most_common(MAX_FUZZY_CANDIDATES):
+            if word in scored:
+                continue
+            word_grams = self._words[word][0]
+            score = 2 * len(grams & word_grams) / (len(grams) + len(word_grams))
+            if score >= MIN_FUZZY_SCORE:
+                scored[word] = score
+        best = sorted(((score, word) for word, score in scored.items()), key=lambda item: (-item[0], item[1]))
+        return best[:MAX_FUZZY_WORDS]
+
+    def _fuzzy_docs(self, query, exclude, limit):
+        # Cada palavra da busca vira uma lista de palavras do vocabulário com
+        # nota. A que tem menos nomes conduz: os nomes são percorridos na
+        # ordem da nota dela e só até completar o limite; as outras palavras
+        # da busca são conferidas nas palavras do próprio nome.
+        tokens = query.split()
+        matches = []
+        for i, token in enumerate(tokens):
+            similar = self._similar_words(token, prefix=i == len(tokens) - 1)
+            if not similar:
+                return []
+            matches.append(similar)
+        matches.sort(key=lambda similar: sum(self._words[w][1] for _, w in similar))
+        driver, others = matches[0], [{w: s for s, w in m} for m in matches[1:]]
+
+        scored = []
+        seen = set()
+        for score, word in driver:
+            start, end = self._range(word, word + '\x00')
+            for i in range(start, end):
+                doc = self._keys[i][1]
+                if doc in exclude or doc in seen:
+                    continue
+                seen.add(doc)
+                words = self._docs[doc][2].split()
+                total = score
+                for other in others:
+                    best = max(other.get(w, 0) for w in words)
+                    if not best:
+                        break
+                    total += best
+                else:
+                    scored.append((total / len(matches), doc))
+                    if len(scored) >= limit:
+                        break
+            if len(scored) >= limit:
+                break
+        scored.sort(key=lambda item: (-item[0], self._docs[item[1]][2]))
+        return [(doc, score) for score, doc in scored]
+
+    def search(self, query, limit=20, offset=0):
+        query = normalize(query)
+        if not query:
+            return [], None
+        wanted = min(MAX_RESULTS, offset + limit + 1)
+        with self._lock:
+            ranked = []
+            for doc in self._prefix_docs(query, MAX_RESULTS):
+                name = self._docs[doc][2]
+                if name == query:
+                    tier = 0
+                elif name.startswith(query):
+                    tier = 1
+                else:
+                    tier = 2
+                ranked.append((tier, len(name), name, doc, 1.0))
+            ranked.sort()
+            if len(ranked) < wanted and len(query) >= 3:
+                exclude = {r[3] for r in ranked}
+                for doc, score in self._fuzzy_docs(query, exclude, wanted - len(ranked)):
+                    ranked.append((3, 0, '', doc, round(score, 3)))
+            page = ranked[offset:offset + limit]
+            results = [{'id': self._docs[doc][0], 'username': self._docs[doc][1], 'score': score}
+                       for _, _, _, doc, score in page]
+        next_offset = offset + limit if len(ranked) > offset + limit else None
+        return results, next_offset
+
+
+# --- Integração com o store ---
+# Decorator no mesmo estilo do CachedUserStore: repassa tudo ao store e
+# mantém o índice em dia com as escritas feitas por este processo. Escritas
+# de outros processos aparecem pela mudança de version(); nesse caso o
+# índice é reconstruído em segundo plano, no máximo a cada rebuild_interval.
+# Como no CachedUserStore, uma escrita local só avança a versão conhecida se
+# ninguém mais gravou antes dela; senão o índice fica marcado para
+# reconstrução. No SQLite a versão não muda com escritas locais.
+
+class IndexedUserStore(UserStore):
+    def __init__(self, store, index, rebuild_interval=30.0):
+        self.store = store
+        self.index = index
+        self.rebuild_interval = rebuild_interval
+        self._built = False
+        self._build_lock = threading.Lock()
+        self._rebuilding = False
+        self._version = None
+        self._checked_at = 0.0
+        self.rebuilds = 0
+
+    def _build(self):
+        version = self.store.version()
+        self.index.build((user['id'], user['username']) for _, user in self.store.all())
+        self._version = version
+        self._checked_at = time.monotonic()
+        self.rebuilds += 1
+
+    def _background_rebuild(self):
+        try:
+            self._build()
+        finally:
+            self._rebuilding = False
+
+    def warm(self):
+        if not self._built:
+            with self._build_lock:
+                if not self._built:
+                    self._build()
+                    self._built = True
+
+    def search(self, query, limit=20, offset=0):
+        # Montagem preguiçosa: o primeiro a buscar paga a leitura do store.
+        if not self._built:
+            self.warm()
+        else:
+            now = time.monotonic()
+            if not self._rebuilding and now - self._checked_at >= self.rebuild_interval:
+                self._checked_at = now
+                if self.store.version() != self._version:
+                    self._rebuilding = True
+                    threading.Thread(target=self._background_rebuild, name='search-rebuild', daemon=True).start()
+        return self.index.search(query, limit, offset)
+
+    def _version_before_write(self):
+        if self._built and self.store.version_includes_own_writes:
+            return self.store.version()
+        return None
+
+    def _sync_version(self, before):
+        if not self._built or not self.store.version_includes_own_writes:
+            return
+        if before == self._version:
+            self._version = self.store.version()
+        else:
+            # Outro processo também mudou o store: a próxima busca reconstrói.
+            self._checked_at = 0.0
+
+    def get(self, email):
+        return self.store.get(email)
+
+    def get_by_id(self, user_id):
+        return self.store.get_by_id(user_id)
+
+    def exists(self, email):
+        return self.store.exists(email)
+
+    def insert(self, email, record):
+        before = self._version_before_write()
+        ok = self.store.insert(email, record)
+        if ok and self._built:
+            self.index.add(record['id'], record['username'])
+            self._sync_version(before)
+        return ok
+
+    def update_field(self, email, field, value):
+        if field != 'username' or not self._built:
+            return self.store.update_field(email, field, value)
+        before = self._version_before_write()
+        ok = self.store.update_field(email, field, value)
+        user = self.store.get(email) if ok else None
+        if user:
+            self.index.add(user['id'], value)
+            self._sync_version(before)
+        return ok
+
+    def rename(self, old_email, new_email):
+        # O índice é por id e não guarda e-mails; trocar o e-mail não muda nada.
+        before = self._version_before_write()
+        ok = self.store.rename(old_email, new_email)
+        if ok:
+            self._sync_version(before)
+        return ok
+
+    def delete(self, email):
+        user = self.store.get(email) if self._built else None
+        before = self._version_before_write()
+        ok = self.store.delete(email)
+        if ok and user:
+            self.index.remove(user['id'])
+            self._sync_version(before)
+        return ok
+
+    def all(self):
+        return self.store.all()
+
+    def count(self):
+        return self.store.count()
+
+    def version(self):
+        return self.store.version()
+
+    @property
+    def version_includes_own_writes(self):
+        return self.store.version_includes_own_writes
+
+    def close(self):
+        self.store.close()
+
+    def stats(self):
+        stats = dict(self.store.stats())
+        stats['search_indexed'] = len(self.index)
+        stats['search_rebuilds'] = self.rebuilds
+        return stats
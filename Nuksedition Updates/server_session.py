@@ -0,0 +1,252 @@
+import heapq
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+# --- Sessões no servidor ---
+# O cookie guarda só um id opaco; os dados da sessão (usuário logado, dados
+# temporários do cadastro, códigos) ficam num store no servidor com prazo de
+# validade. Uma thread em segundo plano apaga as sessões vencidas em lote.
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.modified = False
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self._data = {}
+        self._expiry = []
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        entry = self._data.get(sid)
+        if entry is None:
+            return None
+        expires, data = entry
+        if expires < time.time():
+            return None
+        return expires, dict(data)
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._data[sid] = (expires, dict(data))
+            heapq.heappush(self._expiry, (expires, sid))
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self):
+        # O heap tem entradas antigas de sessões renovadas; só remove a sessão
+        # se o prazo registrado ainda for o mesmo.
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] < now:
+                expires, sid = heapq.heappop(self._expiry)
+                entry = self._data.get(sid)
+                if entry is not None and entry[0] == expires:
+                    del self._data[sid]
+                    removed += 1
+        return removed
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self.serializer = TaggedJSONSerializer()
+        self._lock = threading.Lock()
+        self._connect()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            ' sid TEXT PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' expires REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)')
+
+    def get(self, sid):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, expires FROM sessions WHERE sid = ? AND expires >= ?', (sid, time.time())).fetchone()
+        if row is None:
+            return None
+        return row[1], self.serializer.loads(row[0])
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                (sid, self.serializer.dumps(dict(data)), expires))
+
+    def delete(self, sid):
+        with self._lock:
+            self._conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def sweep(self):
+        with self._lock:
+            return self._conn.execute('DELETE FROM sessions WHERE expires < ?', (time.time(),)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+class SharedSessionStore:
+    # Sessões no backend compartilhado (shared_backend.py); o prazo da chave
+    # faz o papel do sweep.
+    def __init__(self, backend):
+        self.backend = backend
+        self.serializer = TaggedJSONSerializer()
+
+    def get(self, sid):
+        raw = self.backend.get(f'session:{sid}')
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry['expires'] < time.time():
+            return None
+        return entry['expires'], self.serializer.loads(entry['data'])
+
+    def set(self, sid, data, expires):
+        raw = json.dumps({'expires': expires, 'data': self.serializer.dumps(dict(data))})
+        self.backend.set(f'session:{sid}', raw, ttl=max(1, expires - time.time()))
+
+    def delete(self, sid):
+        self.backend.delete(f'session:{sid}')
+
+    def sweep(self):
+        return 0
+
+    def __len__(self):
+        return self.backend.count('session:')
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, ttl=86400, sweep_interval=60):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._sweeper_lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.store.sweep()
+            except Exception:
+                pass
+
+    def _lifetime(self, app, session):
+        if session.permanent:
+            return app.permanent_session_lifetime.total_seconds()
+        return self.ttl
+
+    def open_session(self, app, request):
+        self._ensure_sweeper()
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            entry = self.store.get(sid)
+            if entry is not None:
+                expires, data = entry
+                return ServerSession(data, sid=sid, expires=expires)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        # Novo id ao mudar de privilégio (login, fim do cadastro): um id que
+        # alguém plantou no navegador da vítima deixa de valer. Os dados
+        # continuam na sessão e são gravados com o id novo.
+        if not session.new:
+            self.store.delete(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        session.new = True
+        session.modified = True
+
+    def persist(self, app, session):
+        # Grava ou apaga a sessão no store. Devolve 'set' ou 'delete' quando o
+        # cookie precisa ser enviado ou removido, e None quando nada mudou.
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                return 'delete'
+            return None
+
+        lifetime = self._lifetime(app, session)
+        now = time.time()
+        # Renova o prazo quando passou da metade, sem gravar a cada requisição.
+        stale = session.expires is not None and session.expires - now < lifetime / 2
+        if not (session.modified or session.new or stale):
+            return None
+
+        self.store.set(session.sid, session, now + lifetime)
+        return 'set'
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        action = self.persist(app, session)
+        if action == 'delete':
+            response.delete_cookie(name, domain=domain, path=path)
+        elif action == 'set':
+            response.vary.add('Cookie')
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain, path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
+
+def create_session_interface(config, shared=None):
+    backend = config.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'cookie':
+        return None
+    if backend == 'memory':
+        store = MemorySessionStore()
+    elif backend == 'sqlite':
+        store = SQLiteSessionStore(config['SESSION_DB'])
+    elif backend == 'shared':
+        store = SharedSessionStore(shared)
+    else:
+        raise ValueError(f'Backend de sessão desconhecido: {backend}')
+    return ServerSessionInterface(store, ttl=config.get('SESSION_TTL', 86400),
+                                  sweep_interval=config.get('SESSION_SWEEP_INTERVAL', 60))
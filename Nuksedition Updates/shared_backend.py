@@ -0,0 +1,311 @@
+import heapq
+import math
+import os
+import sqlite3
+import threading
+import time
+
+
+# --- Backend compartilhado ---
+# Estado que precisa ser visto por todos os processos (usuários, sessões,
+# códigos de verificação e contadores de limite de taxa) passa por uma API
+# chave/valor pequena. Os valores são strings e podem ter prazo de validade.
+#
+#   get(key), set(key, value, ttl), add(key, value, ttl) -> bool,
+#   delete(key) -> bool, rename(old, new) -> bool, keys(prefix), count(prefix),
+#   update(key, fn, ttl) -> resultado
+#
+# update() é o leitura-alteração-escrita atômico: fn recebe o valor atual
+# (ou None) e devolve (novo_valor, resultado); novo_valor None apaga a chave.
+# Com ttl=None, update() mantém o prazo que a chave já tinha.
+#
+# SHARED_BACKEND_URL escolhe a implementação:
+#   vazio                 -> LocalBackend (um processo só)
+#   sqlite:///caminho.db  -> SQLiteBackend (vários processos, uma máquina)
+#   redis://host:6379/0   -> RedisBackend (várias máquinas)
+
+
+class LocalBackend:
+    def __init__(self):
+        # chave -> (valor, expira_em ou None)
+        self._data = {}
+        self._expiry = []
+        self._lock = threading.RLock()
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _put(self, key, value, expires):
+        self._data[key] = (value, expires)
+        if expires is not None:
+            heapq.heappush(self._expiry, (expires, key))
+
+    def _sweep(self, now):
+        # O heap tem entradas antigas de chaves regravadas; só apaga se o
+        # prazo registrado ainda for o mesmo.
+        while self._expiry and self._expiry[0][0] < now:
+            expires, key = heapq.heappop(self._expiry)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires:
+                del self._data[key]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._alive(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            self._put(key, value, now + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            if self._alive(key, now) is not None:
+                return False
+            self._put(key, value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def rename(self, old, new):
+        now = time.time()
+        with self._lock:
+            entry = self._alive(old, now)
+            if entry is None or self._alive(new, now) is not None:
+                return False
+            del self._data[old]
+            self._put(new, *entry)
+            return True
+
+    def update(self, key, fn, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            entry = self._alive(key, now)
+            value, result = fn(entry[0] if entry else None)
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                expires = now + ttl if ttl else (entry[1] if entry else None)
+                self._put(key, value, expires)
+            return result
+
+    def keys(self, prefix):
+        now = time.time()
+        with self._lock:
+            return [k for k, (_, expires) in self._data.items()
+                    if k.startswith(prefix) and (expires is None or expires >= now)]
+
+    def count(self, prefix):
+        return len(self.keys(prefix))
+
+
+class SQLiteBackend:
+    # Vários processos na mesma máquina. update() usa BEGIN IMMEDIATE, que
+    # pega o lock de escrita do banco antes de ler.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+        self._last_sweep = time.time()
+        if hasattr(os, 'register_at_fork'):
+            # Conexões SQLite não podem atravessar um fork.
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires REAL'
+            ') WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires)')
+
+    def _maybe_sweep(self, now):
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            self._conn.execute('DELETE FROM kv WHERE expires < ?', (now,))
+
+    def _expires(self, ttl, now):
+        return now + ttl if ttl else None
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+                (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            self._conn.execute('INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)',
+                               (key, value, self._expires(ttl, now)))
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('DELETE FROM kv WHERE key = ? AND expires < ?', (key, now))
+                cur = self._conn.execute('INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, ?, ?)',
+                                         (key, value, self._expires(ttl, now)))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return cur.rowcount > 0
+
+    def delete(self, key):
+        with self._lock:
+            return self._conn.execute('DELETE FROM kv WHERE key = ?', (key,)).rowcount > 0
+
+    def rename(self, old, new):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('DELETE FROM kv WHERE key IN (?, ?) AND expires < ?', (old, new, now))
+                try:
+                    cur = self._conn.execute('UPDATE kv SET key = ? WHERE key = ?', (new, old))
+                    ok = cur.rowcount > 0
+                except sqlite3.IntegrityError:
+                    ok = False
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return ok
+
+    def update(self, key, fn, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT value, expires FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+                    (key, now)).fetchone()
+                value, result = fn(row[0] if row else None)
+                if value is None:
+                    self._conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+                else:
+                    expires = self._expires(ttl, now) if ttl else (row[1] if row else None)
+                    self._conn.execute('INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)',
+                                       (key, value, expires))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return result
+
+    def keys(self, prefix):
+        # Intervalo [prefix, prefix + U+10FFFF) usa a chave primária.
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key FROM kv WHERE key >= ? AND key < ? AND (expires IS NULL OR expires >= ?)',
+                (prefix, prefix + '\U0010ffff', time.time())).fetchall()
+        return [r[0] for r in rows]
+
+    def count(self, prefix):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM kv WHERE key >= ? AND key < ? AND (expires IS NULL OR expires >= ?)',
+                (prefix, prefix + '\U0010ffff', time.time())).fetchone()[0]
+
+
+class RedisBackend:
+    # Qualquer servidor compatível com o protocolo do Redis. update() usa
+    # WATCH/MULTI (otimista), sem scripts Lua.
+    def __init__(self, client, namespace='nuks:'):
+        import redis
+        self.client = client
+        self.namespace = namespace
+        self._errors = redis
+
+    def _k(self, key):
+        return self.namespace + key
+
+    @staticmethod
+    def _ms(ttl):
+        return max(1, math.ceil(ttl * 1000)) if ttl else None
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def get(self, key):
+        return self._decode(self.client.get(self._k(key)))
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self._k(key), value, px=self._ms(ttl))
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self._k(key), value, px=self._ms(ttl), nx=True))
+
+    def delete(self, key):
+        return self.client.delete(self._k(key)) > 0
+
+    def rename(self, old, new):
+        try:
+            return bool(self.client.renamenx(self._k(old), self._k(new)))
+        except self._errors.ResponseError:
+            # A chave antiga não existe.
+            return False
+
+    def update(self, key, fn, ttl=None):
+        k = self._k(key)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(k)
+                    value, result = fn(self._decode(pipe.get(k)))
+                    pipe.multi()
+                    if value is None:
+                        pipe.delete(k)
+                    elif ttl:
+                        pipe.set(k, value, px=self._ms(ttl))
+                    else:
+                        pipe.set(k, value, keepttl=True)
+                    pipe.execute()
+                    return result
+                except self._errors.WatchError:
+                    continue
+
+    def keys(self, prefix):
+        pattern = self._k(prefix).replace('\\', '\\\\').replace('*', '\\*').replace('?', '\\?').replace('[', '\\[')
+        size = len(self.namespace)
+        return [self._decode(k)[size:] for k in self.client.scan_iter(match=pattern + '*', count=1000)]
+
+    def count(self, prefix):
+        return len(self.keys(prefix))
+
+
+def create_backend(url):
+    if not url or url == 'local':
+        return LocalBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        # Importado só aqui: o pacote redis leva ~70 ms para carregar.
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('SHARED_BACKEND_URL usa Redis, mas o pacote "redis" não está instalado')
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f'SHARED_BACKEND_URL desconhecida: {url}')
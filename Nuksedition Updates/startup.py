@@ -0,0 +1,191 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# --- Inicialização ---
+# Mede as etapas caras da inicialização do app e, com FAST_STARTUP=1, deixa
+# parte delas para depois:
+#
+#   run(nome, fn, *args, defer=False)  executa fn medindo o tempo; com
+#                                      defer=True guarda fn para o aquecimento
+#   lazy(nome, factory, defer=False)   objeto criado no primeiro uso (ou no
+#                                      aquecimento, o que vier antes)
+#   prewarm()                          roda o que foi adiado numa thread, com o
+#                                      servidor já aceitando conexões; só a
+#                                      primeira chamada tem efeito
+#   ready()                            True quando não há nada adiado ou o
+#                                      aquecimento terminou
+#
+# O launcher e o ASGI chamam prewarm() ao subir; com outro servidor (flask
+# run, waitress-serve app:app, gunicorn) o app chama na primeira requisição.
+#
+# python app.py --startup-report importa o app num processo novo com
+# -X importtime e imprime os imports e as etapas mais lentas.
+
+PHASES = []
+PREWARM_PHASES = []
+_deferred = []
+_lock = threading.Lock()
+_prewarm_started = False
+_prewarm_done = threading.Event()
+
+
+@contextmanager
+def phase(name, into=PHASES):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        into.append((name, time.perf_counter() - start))
+
+
+def run(name, fn, *args, defer=False):
+    if defer:
+        _deferred.append((name, fn, args))
+        return None
+    with phase(name):
+        return fn(*args)
+
+
+class Deferred:
+    # Repassa tudo ao objeto real, criado pela factory no primeiro acesso.
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._target = None
+        self._target_lock = threading.Lock()
+
+    def resolve(self):
+        target = self._target
+        if target is None:
+            with self._target_lock:
+                if self._target is None:
+                    with phase(self._name, PREWARM_PHASES if _prewarm_started else PHASES):
+                        self._target = self._factory()
+                target = self._target
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+def lazy(name, factory, defer=False):
+    if not defer:
+        return run(name, factory)
+    obj = Deferred(name, factory)
+    _deferred.append((None, obj.resolve, ()))
+    return obj
+
+
+def _run_deferred():
+    while True:
+        with _lock:
+            if not _deferred:
+                _prewarm_done.set()
+                return
+            name, fn, args = _deferred.pop(0)
+        try:
+            if name is None:
+                fn(*args)
+            else:
+                with phase(name, PREWARM_PHASES):
+                    fn(*args)
+        except Exception as e:
+            # Não derruba o processo: a etapa volta a ser tentada no primeiro
+            # uso (objetos lazy) ou fica registrada no log.
+            print(f'Aquecimento: {name or fn} falhou: {e!r}', file=sys.stderr)
+
+
+def prewarm(wait=False):
+    global _prewarm_started
+    if _prewarm_started:
+        return
+    with _lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    if wait or not _deferred:
+        _run_deferred()
+    else:
+        threading.Thread(target=_run_deferred, name='prewarm', daemon=True).start()
+
+
+def ready():
+    return _prewarm_done.is_set() or (not _prewarm_started and not _deferred)
+
+
+# --- Relatório (--startup-report) ---
+
+_CHILD = '''
+import time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+import startup
+startup.prewarm(wait=True)
+startup.dump(elapsed)
+'''
+
+
+def dump(import_seconds):
+    print(json.dumps({'import': import_seconds, 'phases': PHASES, 'prewarm': PREWARM_PHASES}))
+
+
+def parse_importtime(text, module='app'):
+    # Linhas "import time: self [us] | cumulative | pacote". A indentação do
+    # nome dá o nível; os imports saem depois dos filhos, então as entradas
+    # de nível 2 logo antes de 'app' são os imports diretos do app.
+    direct = []
+    pending = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        raw = parts[2].rstrip()
+        name = raw.strip()
+        level = (len(raw) - len(raw.lstrip()) + 1) // 2
+        if level == 1:
+            if name == module:
+                direct = pending
+            pending = []
+        elif level == 2:
+            pending.append((name, int(parts[1]) / 1e6))
+    return sorted(direct, key=lambda item: -item[1])
+
+
+def _ms(seconds):
+    return f'{seconds * 1000:9.1f} ms'
+
+
+def report(root, top=15, stream=None):
+    stream = stream or sys.stdout
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD], cwd=root,
+                          capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        print(proc.stderr, file=sys.stderr)
+        return 1
+    data = json.loads(lines[-1])
+    imports = parse_importtime(proc.stderr)
+    fast = os.getenv('FAST_STARTUP', '0') == '1'
+
+    print(f'Inicialização do NuksEdition (FAST_STARTUP={int(fast)})', file=stream)
+    print(f'{_ms(data["import"])}  import app (total)', file=stream)
+    print('\nImports diretos mais lentos (cumulativo):', file=stream)
+    for name, seconds in imports[:top]:
+        print(f'{_ms(seconds)}  {name}', file=stream)
+    print('\nEtapas de inicialização:', file=stream)
+    for name, seconds in sorted(data['phases'], key=lambda item: -item[1]):
+        print(f'{_ms(seconds)}  {name}', file=stream)
+    if data['prewarm']:
+        print('\nAquecimento em segundo plano (depois de aceitar conexões):', file=stream)
+        for name, seconds in data['prewarm']:
+            print(f'{_ms(seconds)}  {name}', file=stream)
+    return 0
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos do app ficam soltos no diretório acima (como em bench/).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+import time
+
+from search_index import IndexedUserStore, UserSearchIndex
+from user_store import JsonUserStore, SQLiteUserStore
+
+ANA = {'id': '0b8e8c1e-1d2a-4c52-9d5e-0f4e4d8f6a11', 'username': 'Ana',
+       'password_hash': 'pbkdf2:sha256:1000$ab$' + 'cd' * 32, 'data_criacao': '17/10/2026'}
+ZECA = {'id': '7a3f9e21-4c8b-4d1e-8f2a-6b5c0d9e3f47', 'username': 'Zeca',
+        'password_hash': 'pbkdf2:sha256:1000$ef$' + '01' * 32, 'data_criacao': '17/10/2026'}
+
+
+def names(store, query):
+    results, _ = store.search(query)
+    return [r['username'] for r in results]
+
+
+def search_after_rebuild(store, query):
+    # A reconstrução roda numa thread; a busca que a dispara ainda usa o
+    # índice antigo.
+    rebuilds = store.rebuilds
+    names(store, query)
+    deadline = time.monotonic() + 5
+    while store.rebuilds == rebuilds and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return names(store, query)
+
+
+def assert_sees_other_worker_signup(make_store):
+    a = IndexedUserStore(make_store(), UserSearchIndex(), rebuild_interval=0)
+    b = IndexedUserStore(make_store(), UserSearchIndex(), rebuild_interval=0)
+    a.warm()
+    b.warm()
+    assert b.insert('zeca@x.y', ZECA)
+    assert a.insert('ana@x.y', ANA)
+    assert search_after_rebuild(a, 'Zeca') == ['Zeca']
+
+
+def test_sqlite_local_signup_does_not_hide_other_worker_signup(tmp_path):
+    path = str(tmp_path / 'users.db')
+    assert_sees_other_worker_signup(lambda: SQLiteUserStore(path))
+
+
+def test_json_local_signup_does_not_hide_other_worker_signup(tmp_path):
+    path = str(tmp_path / 'users.json')
+    assert_sees_other_worker_signup(lambda: JsonUserStore(path, check_interval=0))
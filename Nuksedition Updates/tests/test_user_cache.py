@@ -0,0 +1,104 @@
+import threading
+
+from user_cache import CachedUserStore
+from user_store import JsonUserStore, SQLiteUserStore
+
+EMAIL = 'ana@x.y'
+RECORD = {'id': '0b8e8c1e-1d2a-4c52-9d5e-0f4e4d8f6a11', 'username': 'Ana',
+          'password_hash': 'pbkdf2:sha256:1000$ab$' + 'cd' * 32, 'data_criacao': '17/10/2026'}
+NEW_HASH = 'pbkdf2:sha256:1000$ef$' + '01' * 32
+
+
+class PausingStore(SQLiteUserStore):
+    # get() lê o registro e, se pedido, espera antes de devolver: é a janela
+    # em que uma escrita pode terminar entre a leitura e o preenchimento do
+    # cache.
+    pause = False
+
+    def get(self, email):
+        user = super().get(email)
+        if self.pause:
+            self.pause = False
+            self.read_done.set()
+            self.resume.wait(5)
+        return user
+
+
+def make_cache(tmp_path):
+    store = PausingStore(str(tmp_path / 'users.db'))
+    store.insert(EMAIL, RECORD)
+    store.read_done = threading.Event()
+    store.resume = threading.Event()
+    return store, CachedUserStore(store, maxsize=100, check_interval=3600)
+
+
+def interleave(store, cache, write):
+    # Leitor busca o registro antigo; a escrita termina; o leitor conclui.
+    store.pause = True
+    reader = threading.Thread(target=cache.get, args=(EMAIL,))
+    reader.start()
+    assert store.read_done.wait(5)
+    write()
+    store.resume.set()
+    reader.join(5)
+
+
+def test_update_during_miss_does_not_cache_stale_record(tmp_path):
+    store, cache = make_cache(tmp_path)
+    interleave(store, cache, lambda: cache.update_field(EMAIL, 'password_hash', NEW_HASH))
+    assert store.get(EMAIL)['password_hash'] == NEW_HASH
+    assert cache.get(EMAIL)['password_hash'] == NEW_HASH
+
+
+def test_delete_during_miss_does_not_cache_deleted_user(tmp_path):
+    store, cache = make_cache(tmp_path)
+    interleave(store, cache, lambda: cache.delete(EMAIL))
+    assert cache.get(EMAIL) is None
+
+
+def test_rename_during_miss_does_not_cache_old_email(tmp_path):
+    store, cache = make_cache(tmp_path)
+    interleave(store, cache, lambda: cache.rename(EMAIL, 'bia@x.y'))
+    assert cache.get(EMAIL) is None
+    assert cache.get('bia@x.y')['id'] == RECORD['id']
+
+
+def test_miss_without_writes_is_cached(tmp_path):
+    store, cache = make_cache(tmp_path)
+    assert cache.get(EMAIL) == RECORD
+    assert cache.get(EMAIL) == RECORD
+    assert cache.stats()['hits'] == 1
+
+
+# --- Dois processos no mesmo arquivo ---
+# Cada CachedUserStore faz o papel de um worker. Uma escrita local de A não
+# pode marcar como vista a mudança que B fez antes dela.
+
+OTHER = {'id': '5f2d7c3a-8b1e-4f0a-9c6d-2e7b1a4c8d90', 'username': 'Caio',
+         'password_hash': 'pbkdf2:sha256:1000$gh$' + '23' * 32, 'data_criacao': '17/10/2026'}
+
+
+def two_workers(make_store):
+    first = make_store()
+    first.insert(EMAIL, RECORD)
+    a = CachedUserStore(first, maxsize=100, check_interval=0)
+    b = CachedUserStore(make_store(), maxsize=100, check_interval=0)
+    assert a.get(EMAIL) == RECORD
+    return a, b
+
+
+def assert_sees_rename(a, b):
+    assert b.rename(EMAIL, 'bia@x.y')
+    assert a.insert('caio@x.y', OTHER)
+    assert a.get(EMAIL) is None
+    assert a.get('bia@x.y')['id'] == RECORD['id']
+
+
+def test_sqlite_local_write_does_not_hide_other_worker_rename(tmp_path):
+    path = str(tmp_path / 'users.db')
+    assert_sees_rename(*two_workers(lambda: SQLiteUserStore(path)))
+
+
+def test_json_local_write_does_not_hide_other_worker_rename(tmp_path):
+    path = str(tmp_path / 'users.json')
+    assert_sees_rename(*two_workers(lambda: JsonUserStore(path, check_interval=0)))
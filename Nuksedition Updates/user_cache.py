@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from compact_records import compact, materialize
+from user_store import UserStore
+
+
+# --- Cache de usuários em memória ---
+# LRU de registros já decodificados, por email. O cache é descartado quando
+# o backend informa uma mudança externa (outro processo gravou); as escritas
+# feitas por este processo atualizam o cache no lugar. Os registros ficam
+# compactos (compact_records.py) e viram dict a cada leitura.
+#
+# Uma leitura que não achou o email no cache busca no backend e guarda o
+# resultado. Se uma escrita deste processo terminar no meio disso, o valor
+# lido já é velho; a geração (_generation) evita que ele volte ao cache. Ela
+# fica ímpar enquanto uma escrita está em andamento e muda a cada escrita, e
+# a leitura só guarda o registro se a geração ainda é a mesma (par) de antes
+# da busca. O PRAGMA data_version do SQLite não pega esse caso: não muda com
+# escritas feitas pela mesma conexão.
+#
+# Nos backends em que a nossa escrita também muda version() (JSON, binário,
+# shared), a versão nova só é aceita se a de antes da escrita era a que o
+# cache já conhecia. Se outro processo gravou nesse meio tempo, o cache é
+# descartado; aceitar a versão sem olhar marcaria a mudança dele como vista.
+# No SQLite a versão não é tocada depois de uma escrita local.
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, _MISSING)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedUserStore(UserStore):
+    def __init__(self, store, maxsize=10000, check_interval=1.0):
+        self.store = store
+        self.check_interval = check_interval
+        self._cache = LRUCache(maxsize)
+        self._write_lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+        self._generation = 0
+        self._version = store.version()
+        self._checked_at = time.monotonic()
+        self.invalidations = 0
+
+    def _revalidate(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = self.store.version()
+        if version != self._version:
+            self._version = version
+            self._invalidate()
+
+    def _invalidate(self):
+        with self._fill_lock:
+            self._cache.clear()
+            self._generation += 2
+        self.invalidations += 1
+
+    def _sync_version(self, before):
+        version = self.store.version()
+        if before != self._version:
+            self._invalidate()
+        self._version = version
+        self._checked_at = time.monotonic()
+
+    @property
+    def version_includes_own_writes(self):
+        return self.store.version_includes_own_writes
+
+    def _bump(self):
+        with self._fill_lock:
+            self._generation += 1
+
+    @contextmanager
+    def _writing(self):
+        with self._write_lock:
+            tracked = self.store.version_includes_own_writes
+            before = self.store.version() if tracked else None
+            self._bump()
+            try:
+                yield
+            finally:
+                self._bump()
+                if tracked:
+                    self._sync_version(before)
+
+    def get(self, email):
+        self._revalidate()
+        user = self._cache.get(email)
+        if user is _MISSING:
+            generation = self._generation
+            user = compact(self.store.get(email))
+            with self._fill_lock:
+                if generation == self._generation and generation % 2 == 0:
+                    self._cache.put(email, user)
+        return materialize(user)
+
+    def exists(self, email):
+        return self.get(email) is not None
+
+    def get_by_id(self, user_id):
+        return self.store.get_by_id(user_id)
+
+    def insert(self, email, record):
+        with self._writing():
+            ok = self.store.insert(email, record)
+            if ok:
+                self._cache.put(email, compact(record))
+            return ok
+
+    def update_field(self, email, field, value):
+        with self._writing():
+            ok = self.store.update_field(email, field, value)
+            user = self._cache.get(email)
+            if ok and user is not _MISSING and user is not None:
+                self._cache.put(email, compact(dict(materialize(user), **{field: value})))
+            elif ok:
+                self._cache.pop(email)
+            return ok
+
+    def rename(self, old_email, new_email):
+        with self._writing():
+            ok = self.store.rename(old_email, new_email)
+            if ok:
+                user = self._cache.pop(old_email)
+                self._cache.put(old_email, None)
+                if user is _MISSING or user is None:
+                    self._cache.pop(new_email)
+                else:
+                    self._cache.put(new_email, user)
+            return ok
+
+    def delete(self, email):
+        with self._writing():
+            ok = self.store.delete(email)
+            self._cache.put(email, None)
+            return ok
+
+    def all(self):
+        return self.store.all()
+
+    def count(self):
+        return self.store.count()
+
+    def version(self):
+        return self.store.version()
+
+    def close(self):
+        self.store.close()
+
+    def stats(self):
+        stats = {
+            'hits': self._cache.hits,
+            'misses': self._cache.misses,
+            'size': len(self._cache),
+            'invalidations': self.invalidations,
+        }
+        stats.update(self.store.stats())
+        return stats
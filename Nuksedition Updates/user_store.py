@@ -0,0 +1,449 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from compact_records import compact, id_key, materialize, record_id_key
+from file_lock import FileLock
+from group_commit import GroupCommitWriter, atomic_write
+from metrics import span
+
+
+# --- Armazenamento de usuários ---
+# Os registros seguem o mesmo formato do NuksEdition.json:
+#   email -> {'id', 'username', 'password_hash', 'data_criacao'}
+# Toda a aplicação fala apenas com a API abaixo (get, get_by_id, insert,
+# update_field, rename, delete), então o backend pode ser trocado sem mexer
+# nas rotas.
+
+USER_FIELDS = ('id', 'username', 'password_hash', 'data_criacao')
+
+
+class UserStore:
+    def get(self, email):
+        raise NotImplementedError
+
+    def get_by_id(self, user_id):
+        raise NotImplementedError
+
+    def exists(self, email):
+        return self.get(email) is not None
+
+    def insert(self, email, record):
+        raise NotImplementedError
+
+    def update_field(self, email, field, value):
+        raise NotImplementedError
+
+    def rename(self, old_email, new_email):
+        raise NotImplementedError
+
+    def delete(self, email):
+        raise NotImplementedError
+
+    def all(self):
+        raise NotImplementedError
+
+    def count(self):
+        return sum(1 for _ in self.all())
+
+    # Token que muda quando outro processo altera os dados; usado pelo cache.
+    # Na maioria dos backends as escritas deste processo também mudam o
+    # token; no SQLite não (PRAGMA data_version ignora a própria conexão).
+    version_includes_own_writes = True
+
+    def version(self):
+        return None
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+# --- Backend padrão: SQLite ---
+# O email é a chave primária (índice B-tree) e o id tem um índice único
+# secundário, então cada leitura ou escrita custa O(log n).
+
+class SQLiteUserStore(UserStore):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+        if hasattr(os, 'register_at_fork'):
+            # Conexões SQLite não podem atravessar um fork (launcher.py).
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS users ('
+            ' email TEXT PRIMARY KEY,'
+            ' id TEXT NOT NULL,'
+            ' username TEXT NOT NULL,'
+            ' password_hash TEXT NOT NULL,'
+            ' data_criacao TEXT NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self._conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS users_id ON users (id)')
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return dict(zip(USER_FIELDS, row))
+
+    def get(self, email):
+        with self._lock:
+            cur = self._conn.execute(
+                'SELECT id, username, password_hash, data_criacao FROM users WHERE email = ?', (email,))
+            return self._row(cur.fetchone())
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            cur = self._conn.execute(
+                'SELECT email, id, username, password_hash, data_criacao FROM users WHERE id = ?', (user_id,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return row[0], self._row(row[1:])
+
+    def exists(self, email):
+        with self._lock:
+            cur = self._conn.execute('SELECT 1 FROM users WHERE email = ?', (email,))
+            return cur.fetchone() is not None
+
+    def insert(self, email, record):
+        try:
+            with self._lock:
+                self._conn.execute(
+                    'INSERT INTO users (email, id, username, password_hash, data_criacao) VALUES (?, ?, ?, ?, ?)',
+                    (email,) + tuple(record[f] for f in USER_FIELDS))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def update_field(self, email, field, value):
+        if field not in USER_FIELDS:
+            raise ValueError(f'Campo desconhecido: {field}')
+        with self._lock:
+            cur = self._conn.execute(f'UPDATE users SET {field} = ? WHERE email = ?', (value, email))
+            return cur.rowcount > 0
+
+    def rename(self, old_email, new_email):
+        try:
+            with self._lock:
+                cur = self._conn.execute('UPDATE users SET email = ? WHERE email = ?', (new_email, old_email))
+                return cur.rowcount > 0
+        except sqlite3.IntegrityError:
+            return False
+
+    def delete(self, email):
+        with self._lock:
+            cur = self._conn.execute('DELETE FROM users WHERE email = ?', (email,))
+            return cur.rowcount > 0
+
+    def all(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT email, id, username, password_hash, data_criacao FROM users').fetchall()
+        for row in rows:
+            yield row[0], self._row(row[1:])
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    version_includes_own_writes = False
+
+    def version(self):
+        with self._lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def insert_many(self, items):
+        # Insere ou atualiza; devolve quantas contas foram gravadas (registros
+        # idênticos aos que já estão no banco não contam).
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    'INSERT INTO users (email, id, username, password_hash, data_criacao) VALUES (?, ?, ?, ?, ?)'
+                    ' ON CONFLICT (email) DO UPDATE SET id = excluded.id, username = excluded.username,'
+                    ' password_hash = excluded.password_hash, data_criacao = excluded.data_criacao'
+                    ' WHERE (id, username, password_hash, data_criacao) IS NOT'
+                    ' (excluded.id, excluded.username, excluded.password_hash, excluded.data_criacao)',
+                    ((email,) + tuple(record[f] for f in USER_FIELDS) for email, record in items))
+                written = self._conn.total_changes - before
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return written
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Backend legado: arquivo JSON inteiro ---
+# Mantido como alternativa (USER_STORE=json). O arquivo decodificado fica em
+# memória, com os registros em formato compacto (compact_records.py), e só
+# é lido de novo quando o arquivo muda. As escritas passam por
+# um único escritor com group commit (temp + fsync + rename) e atualizam
+# essa cópia no lugar. Cada lote segura um lock de arquivo e relê o JSON se
+# outro processo gravou antes, então vários processos podem usar o mesmo
+# arquivo sem perder alterações.
+
+def load_users(path):
+    if not os.path.exists(path): return {}
+    try:
+        with span('store_load'), open(path, 'r') as f: return json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError): return {}
+
+def dump_users(f, users):
+    # Mesmo texto que json.dump(users, f, indent=4), materializando um
+    # registro por vez em vez de montar o dict de dicts inteiro.
+    f.write('{')
+    for i, (email, user) in enumerate(users.items()):
+        record = json.dumps(materialize(user), indent=4).replace('\n', '\n    ')
+        f.write(f'{"," if i else ""}\n    {json.dumps(email)}: {record}')
+    f.write('\n}' if users else '}')
+
+def save_users(path, users):
+    with span('store_save'):
+        atomic_write(path, lambda f: dump_users(f, users))
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # O os.replace do atomic_write sempre troca o inode.
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class JsonUserStore(UserStore):
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._users = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self.loads = 0
+        self._file_lock = FileLock(path + '.lock')
+        self._writer = GroupCommitWriter(self._begin_batch, self._commit_batch, finish=self._file_lock.release)
+
+    def _snapshot(self, force=False):
+        now = time.monotonic()
+        if not force and self._users is not None and now - self._checked_at < self.check_interval:
+            return self._users
+        self._checked_at = now
+        stamp = _file_stamp(self.path)
+        if self._users is None or stamp != self._stamp:
+            self._users = {email: compact(user) for email, user in load_users(self.path).items()}
+            self._stamp = stamp
+            self.loads += 1
+        return self._users
+
+    def get(self, email):
+        return materialize(self._snapshot().get(email))
+
+    def get_by_id(self, user_id):
+        key = id_key(user_id)
+        for email, user in self._snapshot().items():
+            if record_id_key(user) == key:
+                return email, materialize(user)
+        return None
+
+    def _begin_batch(self):
+        self._file_lock.acquire()
+        return dict(self._snapshot(force=True))
+
+    def _commit_batch(self, users):
+        save_users(self.path, users)
+        self._users = users
+        self._stamp = _file_stamp(self.path)
+
+    def _mutate(self, fn):
+        return self._writer.submit(fn)
+
+    def insert(self, email, record):
+        def fn(users):
+            if email in users:
+                return False
+            users[email] = compact({f: record[f] for f in USER_FIELDS})
+            return True
+        return self._mutate(fn)
+
+    def update_field(self, email, field, value):
+        if field not in USER_FIELDS:
+            raise ValueError(f'Campo desconhecido: {field}')
+        def fn(users):
+            if email not in users:
+                return False
+            users[email] = compact(dict(materialize(users[email]), **{field: value}))
+            return True
+        return self._mutate(fn)
+
+    def rename(self, old_email, new_email):
+        def fn(users):
+            if old_email not in users or new_email in users:
+                return False
+            users[new_email] = users.pop(old_email)
+            return True
+        return self._mutate(fn)
+
+    def delete(self, email):
+        def fn(users):
+            return users.pop(email, None) is not None
+        return self._mutate(fn)
+
+    def all(self):
+        items = list(self._snapshot().items())
+        return ((email, materialize(user)) for email, user in items)
+
+    def count(self):
+        return len(self._snapshot())
+
+    def version(self):
+        return _file_stamp(self.path)
+
+    def stats(self):
+        stats = {'file_loads': self.loads}
+        stats.update(self._writer.stats())
+        return stats
+
+
+# --- Backend compartilhado ---
+# USER_STORE=shared guarda os usuários no backend de shared_backend.py
+# (SQLite ou Redis), visível para todos os processos e máquinas:
+#   user:<email> -> registro em JSON, userid:<id> -> email,
+#   users:version -> contador de alterações (invalida os caches locais).
+
+class SharedUserStore(UserStore):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _bump(self):
+        self.backend.update('users:version', lambda v: (str(int(v or 0) + 1), None))
+
+    def get(self, email):
+        raw = self.backend.get(f'user:{email}')
+        return json.loads(raw) if raw else None
+
+    def get_by_id(self, user_id):
+        email = self.backend.get(f'userid:{user_id}')
+        user = self.get(email) if email else None
+        return (email, user) if user else None
+
+    def insert(self, email, record):
+        record = {f: record[f] for f in USER_FIELDS}
+        if not self.backend.add(f'user:{email}', json.dumps(record)):
+            return False
+        self.backend.set(f'userid:{record["id"]}', email)
+        self._bump()
+        return True
+
+    def update_field(self, email, field, value):
+        if field not in USER_FIELDS:
+            raise ValueError(f'Campo desconhecido: {field}')
+        def fn(raw):
+            if raw is None:
+                return None, False
+            return json.dumps(dict(json.loads(raw), **{field: value})), True
+        ok = self.backend.update(f'user:{email}', fn)
+        if ok:
+            self._bump()
+        return ok
+
+    def rename(self, old_email, new_email):
+        if not self.backend.rename(f'user:{old_email}', f'user:{new_email}'):
+            return False
+        user = self.get(new_email)
+        if user:
+            self.backend.set(f'userid:{user["id"]}', new_email)
+        self._bump()
+        return True
+
+    def delete(self, email):
+        user = self.get(email)
+        if not self.backend.delete(f'user:{email}'):
+            return False
+        if user:
+            self.backend.delete(f'userid:{user["id"]}')
+        self._bump()
+        return True
+
+    def all(self):
+        for key in self.backend.keys('user:'):
+            user = self.get(key[len('user:'):])
+            if user:
+                yield key[len('user:'):], user
+
+    def count(self):
+        return self.backend.count('user:')
+
+    def version(self):
+        return self.backend.get('users:version')
+
+
+# --- Migração ---
+
+def migrate_json(json_path, store):
+    # Importa as contas do JSON, atualizando as que já existem. Devolve
+    # quantas foram de fato gravadas.
+    users = load_users(json_path)
+    items = [(email, {f: user[f] for f in USER_FIELDS}) for email, user in users.items()]
+    if hasattr(store, 'insert_many'):
+        return store.insert_many(items)
+    written = 0
+    for email, record in items:
+        if store.insert(email, record):
+            written += 1
+            continue
+        current = store.get(email) or {}
+        changed = [f for f in USER_FIELDS if current.get(f) != record[f]]
+        for field in changed:
+            store.update_field(email, field, record[field])
+        written += bool(changed)
+    return written
+
+
+def create_store(config, shared=None, cache=True):
+    # cache=False devolve o backend sem o LRU (usado pelo migrate-users).
+    store = _create_backend(config, shared)
+    cache_size = config.get('USER_CACHE_SIZE', 0) if cache else 0
+    if cache_size:
+        from user_cache import CachedUserStore
+        store = CachedUserStore(store, maxsize=cache_size,
+                                check_interval=config.get('USER_CACHE_CHECK_INTERVAL', 1.0))
+    return store
+
+
+def _create_backend(config, shared=None):
+    backend = config.get('USER_STORE', 'sqlite')
+    if backend == 'shared':
+        return SharedUserStore(shared)
+    if backend == 'json':
+        return JsonUserStore(config['USERS_FILE'], check_interval=config.get('USER_CACHE_CHECK_INTERVAL', 1.0))
+    if backend == 'binary':
+        from binary_store import BinaryUserStore, json_to_binary
+        path = config['USERS_BINARY_FILE']
+        # Na primeira execução converte o JSON existente.
+        if not os.path.exists(path) and os.path.exists(config['USERS_FILE']):
+            json_to_binary(config['USERS_FILE'], path)
+        return BinaryUserStore(path, check_interval=config.get('USER_CACHE_CHECK_INTERVAL', 1.0))
+    if backend == 'sqlite':
+        db_path = config['USERS_DB']
+        is_new = not os.path.exists(db_path)
+        store = SQLiteUserStore(db_path)
+        # Na primeira execução importa automaticamente o JSON existente.
+        if is_new and os.path.exists(config['USERS_FILE']):
+            migrate_json(config['USERS_FILE'], store)
+        return store
+    raise ValueError(f'Backend de usuários desconhecido: {backend}')
@@ -0,0 +1,108 @@
+import hmac
+import json
+import secrets
+import time
+
+from shared_backend import LocalBackend
+
+
+# --- Códigos de verificação ---
+# Um único serviço para todos os fluxos de código de seis dígitos (cadastro,
+# exclusão de conta, troca de e-mail e de senha). Cada código pertence a um
+# propósito e a um e-mail, expira sozinho e aceita poucas tentativas. Envios
+# e tentativas passam por limites de taxa por e-mail e por IP, o que também
+# impede que cliques em "reenviar" virem uma enxurrada de e-mails. Com um
+# AttemptTracker (attempts.py), erros seguidos também bloqueiam a conta por
+# prazos crescentes, e um IP que erra demais é recusado antes de tudo.
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Tente novamente em {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_every, backend=None, name='bucket'):
+        self.capacity = capacity
+        self.refill_every = refill_every
+        self.backend = backend if backend is not None else LocalBackend()
+        self.name = name
+
+    def consume(self, key, now=None):
+        if now is None:
+            now = time.time()
+
+        def take(current):
+            tokens, updated = json.loads(current) if current else (self.capacity, now)
+            tokens = min(self.capacity, tokens + (now - updated) / self.refill_every)
+            if tokens < 1:
+                return json.dumps([tokens, now]), (1 - tokens) * self.refill_every
+            return json.dumps([tokens - 1, now]), None
+
+        # Um balde que ficou parado até encher de novo não guarda informação
+        # nenhuma; o prazo da chave cuida da limpeza.
+        retry_after = self.backend.update(f'rate:{self.name}:{json.dumps(key)}', take,
+                                          ttl=self.capacity * self.refill_every)
+        if retry_after is not None:
+            raise RateLimited(retry_after)
+
+
+class VerificationCodes:
+    def __init__(self, ttl=600, max_attempts=5,
+                 send_limit=(3, 60), ip_send_limit=(10, 30), ip_attempt_limit=(20, 10), backend=None,
+                 attempts=None):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.attempts = attempts
+        # Códigos e contadores ficam no backend compartilhado, então valem
+        # para todos os processos (veja shared_backend.py).
+        self.backend = backend if backend is not None else LocalBackend()
+        self.sends_per_email = TokenBucket(*send_limit, backend=self.backend, name='send_email')
+        self.sends_per_ip = TokenBucket(*ip_send_limit, backend=self.backend, name='send_ip')
+        self.attempts_per_ip = TokenBucket(*ip_attempt_limit, backend=self.backend, name='attempt_ip')
+
+    @staticmethod
+    def _key(purpose, email):
+        # code:<propósito>:<email> -> [código, tentativas]
+        return f'code:{purpose}:{email}'
+
+    def issue(self, purpose, email, ip=None):
+        now = time.time()
+        self.sends_per_email.consume((purpose, email), now)
+        if ip is not None:
+            self.sends_per_ip.consume(ip, now)
+
+        code = str(secrets.randbelow(900000) + 100000)
+        self.backend.set(self._key(purpose, email), json.dumps([code, 0]), ttl=self.ttl)
+        return code
+
+    def check(self, purpose, email, code, ip=None):
+        if self.attempts is not None:
+            self.attempts.check(purpose, email, ip)
+        if ip is not None:
+            self.attempts_per_ip.consume(ip)
+
+        def attempt(current):
+            if current is None:
+                return None, False
+            expected, attempts = json.loads(current)
+            attempts += 1
+            if attempts > self.max_attempts:
+                return None, False
+            if hmac.compare_digest(str(code).encode(), expected.encode()):
+                return None, True
+            return json.dumps([expected, attempts]), False
+
+        ok = self.backend.update(self._key(purpose, email), attempt)
+        if self.attempts is not None:
+            if ok:
+                self.attempts.success(purpose, email)
+            else:
+                self.attempts.failure(purpose, email, ip)
+        return ok
+
+    def discard(self, purpose, email):
+        self.backend.delete(self._key(purpose, email))
+
+    def __len__(self):
+        return self.backend.count('code:')